@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel import build_panel, select_panel
+
+
+def sales_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2014-12-20", "2015-07-10")
+    df = pd.DataFrame({
+        "Store": np.tile(np.arange(1, 17, dtype=np.int16), len(dates)),
+        "Date": np.repeat(dates, 16),
+    })
+    df["DayOfWeek"] = (df["Date"].dt.dayofweek + 1).astype(np.int8)
+    df["Sales"] = np.where(rng.random(len(df)) < 0.1, 0.0, rng.integers(3000, 9000, len(df)).astype(float))
+    return df
+
+def notebook_panel(df, treated_stores, lift):
+    # the two iterrows loops of AB_testing.ipynb, with a fixed lift in place of random.uniform
+    subset = df.copy()
+    launch = pd.Timestamp("2015-04-17")
+    subset["Group"] = subset["Store"].isin(treated_stores).astype(int)
+    for index, row in subset.iterrows():
+        if (row["Group"] == 1) & (row["Date"] > launch):
+            subset.at[index, "Sales"] = row["Sales"] * round(lift, 2)
+    for index, row in subset.iterrows():
+        if (row["Store"] in [4, 7, 11, 12]) & (row["Date"] < launch):
+            subset.at[index, "Sales"] = row["Sales"] * 0.72
+    subset["pre_post_treatmt"] = (subset["Date"] >= launch).astype(int)
+    subset["did"] = subset["Group"] * subset["pre_post_treatmt"]
+    return subset
+
+
+def test_select_panel_matches_notebook_subset():
+    df = sales_frame()
+    expected = df[(df["Store"] < 15) & (df["DayOfWeek"] == 5) & (df["Sales"] != 0)
+                  & (df["Date"] > "2015-01-01") & (df["Date"] < "2015-07-01")]
+    pd.testing.assert_frame_equal(select_panel(df), expected.reset_index(drop=True))
+
+def test_panel_matches_notebook_loops():
+    df = select_panel(sales_frame())
+    treated = [1, 4, 6, 9, 12, 14]
+    panel = build_panel(df, treated_stores=treated, lift=(1.23, 1.23))
+    expected = notebook_panel(df, treated, 1.23)
+
+    np.testing.assert_allclose(panel["Sales"], expected["Sales"])
+    for col in ("Group", "pre_post_treatmt", "did"):
+        np.testing.assert_array_equal(panel[col], expected[col])
+
+@pytest.mark.parametrize("effect", ["multiplicative", "per_store"])
+def test_lift_stays_within_range(effect):
+    df = select_panel(sales_frame(), max_store=None)
+    panel = build_panel(df, n_treated=5, effect=effect, suppressed_stores=())
+    lifted = panel["did"].astype(bool) & (panel["Date"] > pd.Timestamp("2015-04-17"))
+    ratio = (panel["Sales"] / df["Sales"]).round(6)
+    assert ratio[lifted].between(1.05, 1.4).all() and (ratio[~lifted] == 1).all()
+    if effect == "per_store":
+        assert (ratio[lifted].groupby(panel["Store"][lifted]).nunique() == 1).all()
@@ -6,6 +6,8 @@ from utils import (
     load_file,
     check_nulls,
     compute_part_worth,
+    compute_choice_part_worth,
+    compute_respondent_part_worth,
     plot_part_worth_utility,
     add_row,
     generate_attribute,
@@ -15,6 +17,14 @@ from utils import (
     select_attribute_levels,
     generate_level_selectbox,
     extract_attribute_level_by_id,
+    select_competitors,
+    competitive_scenarios,
+    product_line_optimizer,
+    price_sensitivity,
+    bootstrap_draws,
+    add_importance_intervals,
+    add_share_intervals,
+    design_generator,
     plot_market_share
     )
 
@@ -95,6 +105,8 @@ if "selectbox_option" not in st.session_state:
     st.session_state["selectbox_option"] = len(df.columns.tolist())-1
 if "model" not in st.session_state:
     st.session_state["model"] = None
+if "respondent_model" not in st.session_state:
+    st.session_state["respondent_model"] = None
 
 cols = st.columns([1,0.3])
 with cols[1]:
@@ -118,6 +130,30 @@ Y_col = st.selectbox(
     index=st.session_state['selectbox_option']
     )
 
+survey_type = st.radio("Survey type", ["Ratings-based (OLS)", "Choice-based (MNL)"], horizontal=True)
+cols = st.columns([1,0.3])
+if survey_type == "Choice-based (MNL)":
+    respondent_col = None
+    with cols[0]:
+        task_col = st.selectbox(
+            "Choose a choice task ID column (Y marks the chosen alternative)",
+            options=df.columns.tolist(),
+            )
+    X_cols = [col for col in X_cols if col != task_col]
+else:
+    task_col = None
+    with cols[0]:
+        respondent_col = st.selectbox(
+            "Choose a respondent ID column for respondent-level estimation (optional)",
+            options=[None] + df.columns.tolist(),
+            )
+    with cols[1]:
+        st.write("######")
+        shrinkage = st.checkbox("hierarchical prior", value=True, disabled=respondent_col is None)
+
+if respondent_col is not None:
+    X_cols = [col for col in X_cols if col != respondent_col]
+
 if Y_col in X_cols:
     st.error("ERROR: Selected dependent variable is included in the independet variables list", icon="🚨")
     st.stop()
@@ -129,10 +165,28 @@ else:
 if X_cols:
     # 3. compute part worth utility score
     st.header("3. Compute Part Wortth Utility Score")
-    coef = compute_part_worth(df,X_cols,Y_col)
+    if task_col is not None:
+        coef = compute_choice_part_worth(df, task_col, X_cols, Y_col)
+    else:
+        coef = compute_part_worth(df,X_cols,Y_col)
+    if respondent_col is not None:
+        compute_respondent_part_worth(df, respondent_col, X_cols, Y_col, shrinkage)
+    else:
+        st.session_state["respondent_model"] = None
 else:
     st.stop()
 
+cols = st.columns([0.5,0.5,2])
+with cols[0]:
+    st.write("######")
+    bootstrap = st.checkbox("Bootstrap confidence intervals", disabled=task_col is not None,
+                            help="Resamples respondents (rows without a respondent ID column) and refits the regression")
+with cols[1]:
+    n_replicates = st.number_input("Replicates", min_value=100, max_value=10000, value=2000, step=100, disabled=not bootstrap)
+draws = None
+if bootstrap and task_col is None:
+    draws = bootstrap_draws(df, tuple(X_cols), Y_col, respondent_col, n_replicates)
+
 cols = st.columns([1,3])
 with cols[0]:
     df_coef = pd.DataFrame(coef, index=['part worth utility']).T
@@ -163,6 +217,8 @@ with menu[0]:
         if data['Attribute Coefficient'] is not None:
             total_range = data["Part Worth Range"].sum()
             data["Relative Importance"] = data["Part Worth Range"]/total_range*100
+            if draws is not None:
+                data = add_importance_intervals(data, draws, X_cols)
 
             st.dataframe(data=data[['Attribute Name','Part Worth Range','Relative Importance']],use_container_width=True,hide_index=True)
 
@@ -177,6 +233,9 @@ with menu[0]:
 with st.expander("View data table"):
     st.dataframe(data=data, use_container_width=True, hide_index=True)
 
+with st.expander("Generate a survey design"):
+    design_generator(data)
+
 if data['Attribute Name'].to_list():
     st.subheader('Dollar cost per utility score ')
     cols = st.columns([0.2,1,1,1.5])
@@ -254,34 +313,53 @@ with st.popover("Details in market share simulation"):
 
                 """, unsafe_allow_html=True)
 
-price_levels = data[data["Attribute Name"]==cost_col]["Attribute Levels"].iloc[0]
-df_logit = market_share_simulation(df, price_levels)
-
-cols = st.columns([3,1])
-with cols[0]:
-    st.plotly_chart(plot_market_share(df_logit))
-with cols[1]:
-    st.write("#####")
-    st.markdown("<b>Search by Product ID </b>", unsafe_allow_html=True)
-    extract_attribute_level_by_id(df_logit)
+df_logit = market_share_simulation(data, cost_col, coef)
+if df_logit is not None:
+    if draws is not None and st.session_state["respondent_model"] is None:
+        # intervals come from the aggregate regression, so only alongside its point shares
+        df_logit = add_share_intervals(df_logit, draws, X_cols)
 
-with st.expander("View Data Table"):
-    st.dataframe(df_logit)
+    cols = st.columns([3,1])
+    with cols[0]:
+        st.plotly_chart(plot_market_share(df_logit))
+    with cols[1]:
+        st.write("#####")
+        st.markdown("<b>Search by Product ID </b>", unsafe_allow_html=True)
+        extract_attribute_level_by_id(df_logit)
 
-attributes = data.set_index("Attribute Name").to_dict()["Attribute Levels"]
-del attributes[cost_col]
-n_attributes = len(attributes)
+    with st.expander("View Data Table"):
+        st.dataframe(df_logit)
 
-if (n_attributes > 5) & (n_attributes%4 != 0):
-    n_rows = int(n_attributes/4 + 1)
-elif n_attributes < 5:
-    n_rows = 1
-else:
-    n_rows = int(n_attributes/4)
+    attributes = data.set_index("Attribute Name").to_dict()["Attribute Levels"]
+    del attributes[cost_col]
+    n_attributes = len(attributes)
 
-st.write("####")
-st.markdown("<b>Search by Attribute Levels </b>", unsafe_allow_html=True)
-generate_level_selectbox(df_logit,attributes,n_rows)
+    if (n_attributes > 5) & (n_attributes%4 != 0):
+        n_rows = int(n_attributes/4 + 1)
+    elif n_attributes < 5:
+        n_rows = 1
+    else:
+        n_rows = int(n_attributes/4)
+
+    st.write("####")
+    st.markdown("<b>Search by Attribute Levels </b>", unsafe_allow_html=True)
+    generate_level_selectbox(df_logit,attributes,n_rows)
+
+    st.write("####")
+    st.markdown("<b>Competitive scenarios </b>", unsafe_allow_html=True)
+    competitors, choice_rule = select_competitors(df_logit)
+    competitive_scenarios(df_logit, competitors, choice_rule)
+
+    st.write("####")
+    st.markdown("<b>Product line optimizer </b>", unsafe_allow_html=True)
+    simulated_attributes = {name: levels for name, levels in zip(data["Attribute Name"], data["Attribute Levels"])
+                            if name != cost_col and levels}
+    product_line_optimizer(df_logit, simulated_attributes, competitors)
+
+    st.write("####")
+    st.markdown("<b>Price sensitivity </b>", unsafe_allow_html=True)
+    price_levels = data.loc[data["Attribute Name"] == cost_col, "Attribute Levels"].iloc[0]
+    price_sensitivity(df_logit, price_levels, competitors)
 
 
 #7. misconception
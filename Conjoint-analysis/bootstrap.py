@@ -0,0 +1,110 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.special import logsumexp
+
+from estimation import _respondent_moments
+
+
+N_REPLICATES = 2000
+BATCH_SIZE = 100
+ROW_CHUNK_ELEMENTS = 2**22
+SHARE_CHUNK = 2_000
+
+_data = None
+
+
+def _set_data(*arrays):
+    global _data
+    _data = arrays
+
+def _respondent_coefficients(seed, n_replicates):
+    # a bootstrap sample only reweights the per-respondent X'X and X'y, so each
+    # replicate is one weighted sum and one small solve instead of a refit
+    rng = np.random.default_rng(seed)
+    xtx, xty = _data
+    n_groups = xtx.shape[0]
+    weights = rng.multinomial(n_groups, np.full(n_groups, 1 / n_groups), size=n_replicates).astype(np.float64)
+    return (np.linalg.pinv(np.tensordot(weights, xtx, axes=1)) @ (weights @ xty)[:, :, None])[:, :, 0]
+
+def _row_coefficients(seed, n_replicates):
+    # rows are resampled with multinomial counts drawn chunk by chunk: a binomial share of
+    # the remaining draws goes to the chunk and is split over its rows. X'WX and X'Wy then
+    # take one matrix product per chunk against the flattened row outer products
+    rng = np.random.default_rng(seed)
+    x, y = _data
+    n_rows, n_levels = x.shape
+    xtx = np.zeros((n_replicates, n_levels * n_levels))
+    xty = np.zeros((n_replicates, n_levels))
+    remaining = np.full(n_replicates, n_rows)
+    step = max(1, ROW_CHUNK_ELEMENTS // (n_levels * n_levels))
+
+    for start in range(0, n_rows, step):
+        block = x[start:start + step]
+        n_block = len(block)
+        drawn = rng.binomial(remaining, n_block / (n_rows - start))
+        remaining -= drawn
+        weights = rng.multinomial(drawn, np.full(n_block, 1 / n_block)).astype(np.float64)
+        xtx += weights @ (block[:, :, None] * block[:, None, :]).reshape(n_block, -1)
+        xty += weights @ (block * y[start:start + step, None])
+    return (np.linalg.pinv(xtx.reshape(-1, n_levels, n_levels)) @ xty[:, :, None])[:, :, 0]
+
+def bootstrap_part_worths(df, X_cols: list, Y_col: str, respondent_col=None, n_replicates: int = N_REPLICATES,
+                          n_jobs=None, seed=0):
+    # resamples respondents (rows when respondent_col is None); returns (replicates, X_cols) OLS draws
+    if respondent_col is None:
+        func = _row_coefficients
+        data = (df[X_cols].to_numpy(dtype=np.float64), df[Y_col].to_numpy(dtype=np.float64))
+    else:
+        func = _respondent_coefficients
+        _, _, xtx, xty, _ = _respondent_moments(df, respondent_col, X_cols, Y_col)
+        data = (xtx, xty)
+
+    # replicates run in BATCH_SIZE batches, each with its own spawned seed
+    sizes = [BATCH_SIZE] * (n_replicates // BATCH_SIZE)
+    if n_replicates % BATCH_SIZE:
+        sizes.append(n_replicates % BATCH_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(sizes))
+    if n_jobs <= 1:
+        _set_data(*data)
+        results = list(map(func, seeds, sizes))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_set_data, initargs=data) as pool:
+            results = list(pool.map(func, seeds, sizes))
+    return np.concatenate(results)
+
+def percentile_interval(draws, ci: float = 95, axis=0):
+    tail = (100 - ci) / 2
+    return np.percentile(draws, tail, axis=axis), np.percentile(draws, 100 - tail, axis=axis)
+
+def importance_draws(draws, columns, attributes: dict):
+    # relative importance (%) of each attribute per draw, from its part-worth range
+    position = {col: i for i, col in enumerate(columns)}
+    ranges = np.stack([np.ptp(draws[:, [position[level] for level in levels]], axis=1)
+                       for levels in attributes.values()], axis=1)
+    return ranges / ranges.sum(axis=1, keepdims=True) * 100
+
+def share_interval(draws, columns, levels, design, ci: float = 95, chunk_size=SHARE_CHUNK):
+    # logit share interval of every design row across draws; the normaliser of each draw
+    # is accumulated over row chunks first so the (draws, rows) block stays bounded
+    position = {col: i for i, col in enumerate(columns)}
+    part_worths = np.zeros((draws.shape[0], len(levels)), dtype=np.float32)
+    for j, level in enumerate(levels):
+        if level in position:
+            part_worths[:, j] = draws[:, position[level]]
+
+    design = np.asarray(design, dtype=np.float32)
+    normaliser = np.full(draws.shape[0], -np.inf)
+    for start in range(0, design.shape[0], chunk_size):
+        utilities = part_worths @ design[start:start + chunk_size].T
+        normaliser = np.logaddexp(normaliser, logsumexp(utilities, axis=1))
+
+    lower = np.empty(design.shape[0])
+    upper = np.empty(design.shape[0])
+    for start in range(0, design.shape[0], chunk_size):
+        rows = slice(start, start + chunk_size)
+        shares = np.exp(part_worths @ design[rows].T - normaliser[:, None])
+        lower[rows], upper[rows] = percentile_interval(shares, ci)
+    return lower, upper
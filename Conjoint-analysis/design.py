@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+
+MAX_PASSES = 20
+N_STARTS = 5
+RIDGE = 1e-6
+
+
+def model_matrix(codes, n_levels):
+    # intercept plus dummy coding with the first level of each attribute as reference
+    n_params = 1 + int(np.sum(np.asarray(n_levels) - 1))
+    offsets = np.concatenate([[1], 1 + np.cumsum(np.asarray(n_levels) - 1)[:-1]])
+    x = np.zeros((codes.shape[0], n_params))
+    x[:, 0] = 1
+    rows, attributes = np.nonzero(codes > 0)
+    x[rows, offsets[attributes] + codes[rows, attributes] - 1] = 1
+    return x
+
+def d_efficiency(codes, n_levels):
+    x = model_matrix(codes, n_levels)
+    sign, logdet = np.linalg.slogdet(x.T @ x / len(x))
+    return float(np.exp(logdet / x.shape[1])) if sign > 0 else 0.0
+
+def _sherman_morrison(inverse, x, sign):
+    # (M + sign * x x')^-1 from M^-1
+    vx = inverse @ x
+    return inverse - sign * np.outer(vx, vx) / (1 + sign * x @ vx)
+
+def _coordinate_exchange(codes, n_levels, max_passes, rng):
+    n_runs, n_attributes = codes.shape
+    offsets = np.concatenate([[1], 1 + np.cumsum(np.asarray(n_levels) - 1)[:-1]])
+    x = model_matrix(codes, n_levels)
+    # a small ridge keeps random starts invertible; it does not change the argmax of the swaps
+    inverse = np.linalg.inv(x.T @ x + RIDGE * np.eye(x.shape[1]))
+
+    for _ in range(max_passes):
+        improved = False
+        for i in rng.permutation(n_runs):
+            for a in rng.permutation(n_attributes):
+                # every level of attribute a in run i, scored with the determinant lemma:
+                # det ratio of swapping row x for y is (1 + y'Vy)(1 - x'Vx) + (x'Vy)^2
+                block = slice(offsets[a], offsets[a] + n_levels[a] - 1)
+                y = np.repeat(x[i][None, :], n_levels[a], axis=0)
+                y[:, block] = np.eye(n_levels[a])[:, 1:]
+                vx = inverse @ x[i]
+                vy = y @ inverse
+                ratio = (1 + np.einsum("lp,lp->l", vy, y)) * (1 - x[i] @ vx) + (vy @ x[i]) ** 2
+
+                best = int(np.argmax(ratio))
+                if best != codes[i, a] and ratio[best] > 1 + 1e-9:
+                    inverse = _sherman_morrison(inverse, x[i], -1)
+                    inverse = _sherman_morrison(inverse, y[best], 1)
+                    codes[i, a] = best
+                    x[i] = y[best]
+                    improved = True
+        if not improved:
+            break
+    return codes
+
+def generate_design(attributes: dict, n_runs: int, n_starts=N_STARTS, max_passes=MAX_PASSES, seed=0):
+    # D-optimal runs over the attribute levels by coordinate exchange from random starts
+    n_levels = np.array([len(levels) for levels in attributes.values()])
+    n_params = 1 + int(np.sum(n_levels - 1))
+    if n_runs < n_params:
+        raise ValueError(f"at least {n_params} runs are needed to estimate {n_params} parameters, got {n_runs}")
+
+    rng = np.random.default_rng(seed)
+    best_codes, best_efficiency = None, -1.0
+    for _ in range(n_starts):
+        codes = np.stack([rng.integers(0, n, n_runs) for n in n_levels], axis=1)
+        codes = _coordinate_exchange(codes, n_levels, max_passes, rng)
+        efficiency = d_efficiency(codes, n_levels)
+        if efficiency > best_efficiency:
+            best_codes, best_efficiency = codes, efficiency
+    return best_codes, best_efficiency
+
+def choice_codes(base_codes, n_levels, n_alternatives):
+    # shifted choice design: alternative j raises every level of the base run by j (mod levels),
+    # so alternatives in a task never share a level of an attribute with enough levels
+    shifts = np.arange(n_alternatives)[None, :, None]
+    return (base_codes[:, None, :] + shifts) % np.asarray(n_levels)[None, None, :]
+
+def design_frame(codes, attributes: dict):
+    # dummy columns for every level, in the layout of data/sample_data.csv
+    levels = [level for values in attributes.values() for level in values]
+    n_levels = [len(values) for values in attributes.values()]
+    offsets = np.concatenate([[0], np.cumsum(n_levels)[:-1]])
+    dummies = np.zeros((codes.shape[0], len(levels)), dtype=np.uint8)
+    dummies[np.repeat(np.arange(codes.shape[0]), codes.shape[1]), (codes + offsets).ravel()] = 1
+    return pd.DataFrame(dummies, columns=levels)
+
+def conjoint_design(attributes: dict, n_runs: int, n_alternatives=None, seed=0):
+    # ratings design (one profile per run) or, with n_alternatives, a long-format choice
+    # design with task and alternative columns ready for the MNL estimator
+    n_levels = [len(levels) for levels in attributes.values()]
+    codes, efficiency = generate_design(attributes, n_runs, seed=seed)
+
+    if n_alternatives is None:
+        design = design_frame(codes, attributes)
+        design.index = pd.RangeIndex(1, len(design) + 1, name="Run")
+        return design, efficiency
+
+    alternatives = choice_codes(codes, n_levels, n_alternatives)
+    design = design_frame(alternatives.reshape(-1, len(n_levels)), attributes)
+    design.insert(0, "alternative", np.tile(np.arange(1, n_alternatives + 1), n_runs))
+    design.insert(0, "task", np.repeat(np.arange(1, n_runs + 1), n_alternatives))
+    design.index = pd.RangeIndex(1, len(design) + 1, name="Run")
+    return design, efficiency
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def _respondent_moments(df, respondent_col, X_cols, Y_col):
+    # tasks are scattered into a zero-padded (respondent, task, level) array; padded rows
+    # add nothing to X'X or X'y, so unequal task counts need no special casing.
+    # Without a respondent column every row is its own group
+    groups = df[respondent_col].to_numpy() if respondent_col is not None else np.arange(len(df))
+    ids, respondent = np.unique(groups, return_inverse=True)
+    order = np.argsort(respondent, kind="stable")
+    respondent = respondent[order]
+    x = df[X_cols].to_numpy(dtype=np.float64)[order]
+    y = df[Y_col].to_numpy(dtype=np.float64)[order]
+
+    counts = np.bincount(respondent, minlength=len(ids))
+    task = np.arange(len(respondent)) - np.repeat(np.cumsum(counts) - counts, counts)
+    x_padded = np.zeros((len(ids), counts.max(), len(X_cols)))
+    y_padded = np.zeros((len(ids), counts.max()))
+    x_padded[respondent, task] = x
+    y_padded[respondent, task] = y
+
+    xtx = np.einsum("rtk,rtl->rkl", x_padded, x_padded)
+    xty = np.einsum("rtk,rt->rk", x_padded, y_padded)
+    yty = np.einsum("rt,rt->r", y_padded, y_padded)
+    return ids, counts, xtx, xty, yty
+
+def _hierarchical(xtx, xty, yty, counts, n_iter, tol):
+    # normal-normal model fitted by EM: y_r = X_r b_r + e, b_r ~ N(mu, Sigma), e ~ N(0, s2)
+    n_respondents, n_levels = xty.shape
+    pooled = np.linalg.pinv(xtx.sum(axis=0)) @ xty.sum(axis=0)
+    mu = pooled
+    sigma = np.eye(n_levels)
+    residual = yty.sum() - 2 * pooled @ xty.sum(axis=0) + pooled @ xtx.sum(axis=0) @ pooled
+    s2 = max(residual / counts.sum(), 1e-8)
+    eye = np.eye(n_levels)
+
+    for _ in range(n_iter):
+        prior_precision = np.linalg.inv(sigma)
+        precision = xtx / s2 + prior_precision
+        rhs = xty / s2 + prior_precision @ mu
+        means = np.linalg.solve(precision, rhs[:, :, None])[:, :, 0]
+        covariances = np.linalg.inv(precision)
+
+        new_mu = means.mean(axis=0)
+        centered = means - new_mu
+        sigma = (centered.T @ centered + covariances.sum(axis=0)) / n_respondents
+        # keep Sigma invertible when dummy sets are collinear
+        sigma += eye * (1e-6 * np.trace(sigma) / n_levels)
+
+        fitted = np.einsum("rk,rkl,rl->r", means, xtx, means)
+        residual = yty - 2 * np.einsum("rk,rk->r", means, xty) + fitted
+        s2 = max((residual.sum() + np.einsum("rkl,rlk->", xtx, covariances)) / counts.sum(), 1e-8)
+
+        converged = np.abs(new_mu - mu).max() < tol
+        mu = new_mu
+        if converged:
+            break
+
+    return means, mu
+
+def respondent_part_worths(df, respondent_col, X_cols: list, Y_col: str, shrinkage=True, n_iter=50, tol=1e-6):
+    ids, counts, xtx, xty, yty = _respondent_moments(df, respondent_col, X_cols, Y_col)
+
+    if shrinkage:
+        part_worths, population = _hierarchical(xtx, xty, yty, counts, n_iter, tol)
+    else:
+        # minimum-norm least squares per respondent, like the pooled sm.OLS fit
+        part_worths = (np.linalg.pinv(xtx) @ xty[:, :, None])[:, :, 0]
+        population = part_worths.mean(axis=0)
+
+    return {
+        "respondents": ids,
+        "columns": list(X_cols),
+        "part_worths": part_worths.astype(np.float32),
+        "population": pd.Series(population, index=X_cols),
+    }
+
+def align_part_worths(estimate, levels):
+    # (respondents, levels) matrix in the simulator's level order; unknown levels score 0
+    position = {col: i for i, col in enumerate(estimate["columns"])}
+    aligned = np.zeros((estimate["part_worths"].shape[0], len(levels)), dtype=np.float32)
+    for j, level in enumerate(levels):
+        if level in position:
+            aligned[:, j] = estimate["part_worths"][:, position[level]]
+    return aligned
+
+class ChoiceModel:
+    # the parts of a statsmodels results object the app reads: params, predict, summary
+    def __init__(self, params, bse, llf, llnull, n_obs, n_tasks, n_iter):
+        self.params = params
+        self.bse = bse
+        self.llf = llf
+        self.llnull = llnull
+        self.nobs = n_obs
+        self.n_tasks = n_tasks
+        self.n_iter = n_iter
+
+    def predict(self, exog):
+        return np.atleast_2d(np.asarray(exog, dtype=np.float64)) @ self.params.to_numpy()
+
+    def summary(self):
+        z = self.params / self.bse
+        table = pd.DataFrame({
+            "coef": self.params,
+            "std err": self.bse,
+            "z": z,
+            "P>|z|": 2 * stats.norm.sf(np.abs(z)),
+        })
+        header = (f"Multinomial logit   alternatives: {self.nobs}   tasks: {self.n_tasks}   iterations: {self.n_iter}\n"
+                  f"Log-likelihood: {self.llf:.3f}   LL-Null: {self.llnull:.3f}   "
+                  f"McFadden R2: {1 - self.llf / self.llnull:.4f}\n\n")
+        return header + table.to_string(float_format=lambda x: f"{x:.4f}")
+
+def _grouped_probabilities(utilities, starts, group):
+    # softmax within each task, shifted by the task maximum
+    z = utilities - np.maximum.reduceat(utilities, starts)[group]
+    np.exp(z, out=z)
+    denominator = np.add.reduceat(z, starts)
+    return z / denominator[group], denominator
+
+def _mnl_terms(beta, x, chosen, starts, group, n_chosen):
+    utilities = x @ beta
+    p, denominator = _grouped_probabilities(utilities, starts, group)
+    shift = np.maximum.reduceat(utilities, starts)
+    llf = chosen @ utilities - n_chosen @ (np.log(denominator) + shift)
+
+    gradient = x.T @ (chosen - n_chosen[group] * p)
+    weighted = p[:, None] * x
+    task_means = np.add.reduceat(weighted, starts)
+    hessian = -(x.T @ (n_chosen[group][:, None] * weighted) - task_means.T @ (n_chosen[:, None] * task_means))
+    return llf, gradient, hessian
+
+def fit_mnl(df, task_col, X_cols: list, choice_col: str, max_iter=100, tol=1e-8):
+    # long format: one row per alternative, choice_col is 1 for the chosen alternative(s)
+    codes = pd.factorize(df[task_col])[0]
+    order = np.argsort(codes, kind="stable")
+    task = codes[order]
+    x = df[X_cols].to_numpy(dtype=np.float64)[order]
+    chosen = df[choice_col].to_numpy(dtype=np.float64)[order]
+
+    starts = np.flatnonzero(np.r_[True, task[1:] != task[:-1]])
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(task)]))
+    n_chosen = np.add.reduceat(chosen, starts)
+    n_alternatives = np.diff(np.r_[starts, len(task)])
+    llnull = -(n_chosen @ np.log(n_alternatives))
+
+    beta = np.zeros(len(X_cols))
+    llf, gradient, hessian = _mnl_terms(beta, x, chosen, starts, group, n_chosen)
+    for n_iter in range(1, max_iter + 1):
+        # minimum-norm Newton step: full dummy coding leaves one direction per attribute unidentified
+        step = np.linalg.lstsq(-hessian, gradient, rcond=None)[0]
+        scale = 1.0
+        while True:
+            candidate = _mnl_terms(beta + scale * step, x, chosen, starts, group, n_chosen)
+            if candidate[0] >= llf - 1e-12 or scale < 1e-8:
+                break
+            scale /= 2
+        beta = beta + scale * step
+        llf, gradient, hessian = candidate
+        if np.abs(scale * step).max() < tol:
+            break
+
+    bse = np.sqrt(np.clip(np.diag(np.linalg.pinv(-hessian)), 0, None))
+    return ChoiceModel(pd.Series(beta, index=X_cols), pd.Series(bse, index=X_cols),
+                       llf, llnull, len(task), len(starts), n_iter)
@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulation import design_matrix
+
+
+MAX_EXHAUSTIVE_LINES = 5_000_000
+MAX_EXHAUSTIVE_WORK = 200_000_000
+COMBINATION_BATCH = 20_000
+MAX_BEAM_BLOCK = 5_000_000
+
+_weights = None
+_competition = None
+
+
+def top_k_profiles(part_worths, n_levels, offsets, k=10):
+    # best-first branch and bound over the per-attribute level rankings: a profile is
+    # reached by stepping attributes down their sorted part-worths in index order, so each
+    # profile has one parent and utilities never increase along a path
+    part_worths = np.asarray(part_worths, dtype=np.float64)
+    order = [np.argsort(-part_worths[o:o + n], kind="stable") for o, n in zip(offsets, n_levels)]
+    ranked = [part_worths[o:o + n][idx] for o, n, idx in zip(offsets, n_levels, order)]
+    n_attributes = len(n_levels)
+
+    start = (0,) * n_attributes
+    heap = [(-sum(values[0] for values in ranked), start, 0)]
+    found = []
+    while heap and len(found) < k:
+        neg_utility, ranks, last = heapq.heappop(heap)
+        found.append((ranks, -neg_utility))
+        for a in range(last, n_attributes):
+            if ranks[a] + 1 < n_levels[a]:
+                child = ranks[:a] + (ranks[a] + 1,) + ranks[a + 1:]
+                utility = -neg_utility - ranked[a][ranks[a]] + ranked[a][ranks[a] + 1]
+                heapq.heappush(heap, (-utility, child, a))
+
+    codes = np.array([[order[a][r] for a, r in enumerate(ranks)] for ranks, _ in found], dtype=np.intp)
+    utilities = np.array([utility for _, utility in found])
+    return codes.reshape(len(found), n_attributes), utilities
+
+def _choice_weights(part_worths, candidate_design, competitor_design):
+    # exp-utilities shifted per respondent row; part_worths is (levels,) or (respondents, levels)
+    part_worths = np.atleast_2d(np.asarray(part_worths, dtype=np.float64))
+    utilities = part_worths @ np.asarray(candidate_design, dtype=np.float64).T
+    competitor_utilities = part_worths @ np.asarray(competitor_design, dtype=np.float64).T
+
+    shift = np.maximum(utilities.max(axis=1), competitor_utilities.max(axis=1, initial=-np.inf))
+    weights = np.exp(utilities - shift[:, None])
+    competition = np.exp(competitor_utilities - shift[:, None]).sum(axis=1)
+    return weights, competition
+
+def line_shares(lines, weights, competition):
+    # logit share of each line (rows of candidate indices), averaged over respondent rows
+    own = weights[:, lines].sum(axis=-1)
+    return (own / (own + competition[:, None])).mean(axis=0)
+
+def beam_search_line(part_worths, candidate_design, competitor_design, n_products, beam_width=50):
+    weights, competition = _choice_weights(part_worths, candidate_design, competitor_design)
+    n_rows, n_candidates = weights.shape
+    n_products = min(n_products, n_candidates)
+
+    beams = [()]
+    own = np.zeros((n_rows, 1))
+    block = max(1, MAX_BEAM_BLOCK // max(1, n_rows * len(beams)))
+
+    for _ in range(n_products):
+        scores = np.empty((len(beams), n_candidates))
+        for start in range(0, n_candidates, block):
+            total = own[:, :, None] + weights[:, None, start:start + block]
+            scores[:, start:start + block] = (total / (total + competition[:, None, None])).mean(axis=0)
+        for b, beam in enumerate(beams):
+            scores[b, list(beam)] = -np.inf
+
+        next_beams = []
+        seen = set()
+        for flat in np.argsort(-scores, axis=None, kind="stable"):
+            b, p = divmod(int(flat), n_candidates)
+            if not np.isfinite(scores[b, p]):
+                break
+            line = tuple(sorted(beams[b] + (p,)))
+            if line not in seen:
+                seen.add(line)
+                next_beams.append(line)
+            if len(next_beams) == beam_width:
+                break
+
+        beams = next_beams
+        own = weights[:, np.array(beams)].sum(axis=-1)
+        block = max(1, MAX_BEAM_BLOCK // max(1, n_rows * len(beams)))
+
+    shares = line_shares(np.array(beams), weights, competition)
+    best = int(np.argmax(shares))
+    return list(beams[best]), float(shares[best])
+
+def _set_weights(weights, competition):
+    global _weights, _competition
+    _weights, _competition = weights, competition
+
+def _best_in_batch(lines):
+    shares = line_shares(lines, _weights, _competition)
+    best = int(np.argmax(shares))
+    return lines[best].tolist(), float(shares[best])
+
+def _combination_batches(n_candidates, n_products, batch_size):
+    combinations = itertools.combinations(range(n_candidates), n_products)
+    while True:
+        batch = np.fromiter(itertools.chain.from_iterable(itertools.islice(combinations, batch_size)),
+                            dtype=np.intp)
+        if batch.size == 0:
+            return
+        yield batch.reshape(-1, n_products)
+
+def exhaustive_line(part_worths, candidate_design, competitor_design, n_products, n_jobs=None):
+    weights, competition = _choice_weights(part_worths, candidate_design, competitor_design)
+    n_candidates = weights.shape[1]
+    n_products = min(n_products, n_candidates)
+    n_lines = math.comb(n_candidates, n_products)
+    if n_lines > MAX_EXHAUSTIVE_LINES:
+        raise ValueError(f"{n_lines} candidate lines is too many to enumerate; use beam_search_line instead")
+
+    # bound the (respondents, lines, products) gather inside each batch
+    batch_size = max(1, min(COMBINATION_BATCH, MAX_BEAM_BLOCK // (weights.shape[0] * n_products)))
+    n_jobs = n_jobs or os.cpu_count() or 1
+    batches = _combination_batches(n_candidates, n_products, batch_size)
+    if n_jobs <= 1 or n_lines <= batch_size:
+        _set_weights(weights, competition)
+        results = [_best_in_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_set_weights,
+                                 initargs=(weights, competition)) as pool:
+            results = list(pool.map(_best_in_batch, batches))
+
+    return max(results, key=lambda result: result[1])
+
+def optimize_product_line(part_worths, n_levels, offsets, competitor_design, n_products,
+                          pool_size=200, beam_width=50, exhaustive=None, n_jobs=None):
+    # candidates are the pool_size best single profiles for the average respondent,
+    # found without enumerating the design space
+    mean_part_worths = np.atleast_2d(part_worths).mean(axis=0)
+    codes, _ = top_k_profiles(mean_part_worths, n_levels, offsets, pool_size)
+    candidates = design_matrix(codes, offsets, int(np.sum(n_levels)))
+    # a small design space can hold fewer profiles than the requested line
+    n_products = min(n_products, len(codes))
+
+    if exhaustive is None:
+        n_lines = math.comb(len(codes), n_products)
+        n_rows = np.atleast_2d(part_worths).shape[0]
+        exhaustive = n_lines <= MAX_EXHAUSTIVE_LINES and n_lines * n_rows * n_products <= MAX_EXHAUSTIVE_WORK
+    if exhaustive:
+        line, share = exhaustive_line(part_worths, candidates, competitor_design, n_products, n_jobs)
+    else:
+        line, share = beam_search_line(part_worths, candidates, competitor_design, n_products, beam_width)
+
+    return codes[line], share
@@ -0,0 +1,74 @@
+import re
+
+import numpy as np
+from scipy.special import expit, logsumexp
+
+
+N_PRICE_POINTS = 500
+MAX_CURVE_BLOCK = 5_000_000
+
+PRICE_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def parse_price(level):
+    # "Price50" -> 50.0; None when the level name carries no number
+    match = PRICE_PATTERN.search(str(level))
+    return float(match.group()) if match else None
+
+def price_grid(prices, n_points=N_PRICE_POINTS):
+    return np.linspace(min(prices), max(prices), n_points)
+
+def interpolate_price_utility(prices, part_worths, grid):
+    # piecewise-linear part-worth between the tested price levels; part_worths is
+    # (levels,) or (respondents, levels) in the order of prices; returns (rows, grid)
+    prices = np.asarray(prices, dtype=np.float64)
+    order = np.argsort(prices)
+    xp = prices[order]
+    part_worths = np.atleast_2d(np.asarray(part_worths, dtype=np.float64))[:, order]
+
+    left = np.clip(np.searchsorted(xp, grid, side="right") - 1, 0, len(xp) - 2)
+    t = (np.asarray(grid) - xp[left]) / (xp[left + 1] - xp[left])
+    return part_worths[:, left] * (1 - t) + part_worths[:, left + 1] * t
+
+def demand_curves(product_utilities, price_utilities, competitor_utilities=None, outside_utility=None,
+                  max_block=MAX_CURVE_BLOCK):
+    # share of every product at every grid price, each product facing the competitors
+    # on its own, plus a no-purchase option when its utility is given. Dummy-coded OLS
+    # part-worths have no purchase threshold (0 is only the reference level), so one of
+    # the two is required. product_utilities (rows, products) exclude price, price_utilities
+    # (rows, grid), competitor_utilities (rows, competitors) include their price,
+    # outside_utility is a scalar or (rows,); rows are averaged
+    product_utilities = np.atleast_2d(product_utilities).astype(np.float32)
+    price_utilities = np.atleast_2d(price_utilities).astype(np.float32)
+    n_rows, n_products = product_utilities.shape
+    n_points = price_utilities.shape[1]
+
+    alternatives = []
+    if competitor_utilities is not None and np.size(competitor_utilities) > 0:
+        alternatives.append(np.atleast_2d(competitor_utilities))
+    if outside_utility is not None:
+        alternatives.append(np.broadcast_to(np.asarray(outside_utility, dtype=np.float64), (n_rows,))[:, None])
+    if not alternatives:
+        raise ValueError("demand curves need competitor utilities or an outside-option utility")
+    competition = logsumexp(np.concatenate(alternatives, axis=1), axis=1).astype(np.float32)
+
+    shares = np.zeros((n_points, n_products))
+    step = max(1, max_block // (n_points * n_products))
+    for start in range(0, n_rows, step):
+        rows = slice(start, start + step)
+        # binary logit of own product vs competition, evaluated for the whole (row, price, product) block
+        utilities = price_utilities[rows, :, None] + (product_utilities[rows] - competition[rows, None])[:, None, :]
+        shares += expit(utilities, out=utilities).sum(axis=0, dtype=np.float64)
+    return shares / n_rows
+
+def optimal_prices(grid, demand, unit_cost=0.0):
+    # revenue (or margin with a unit cost) per grid price and product, and its maximiser
+    revenue = (np.asarray(grid) - unit_cost)[:, None] * demand
+    best = revenue.argmax(axis=0)
+    columns = np.arange(demand.shape[1])
+    return {
+        "revenue": revenue,
+        "optimal_price": np.asarray(grid)[best],
+        "optimal_share": demand[best, columns],
+        "optimal_revenue": revenue[best, columns],
+    }
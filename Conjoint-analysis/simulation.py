@@ -0,0 +1,148 @@
+import numpy as np
+
+
+MAX_SHARE_BLOCK = 5_000_000
+
+
+def level_index(attributes: dict):
+    # flat level order shared by the design matrix and the part-worth vector
+    names = list(attributes)
+    n_levels = np.array([len(attributes[name]) for name in names])
+    offsets = np.concatenate([[0], np.cumsum(n_levels)[:-1]])
+    levels = [level for name in names for level in attributes[name]]
+    return names, levels, n_levels, offsets
+
+def part_worth_vector(levels, coef: dict):
+    return np.array([coef.get(level, 0.0) for level in levels], dtype=np.float64)
+
+def enumerate_profiles(n_levels):
+    # every combination of levels as a compact (n_profiles, n_attributes) integer array
+    dtype = np.uint8 if max(n_levels) <= np.iinfo(np.uint8).max else np.uint16
+    return np.indices(n_levels, dtype=dtype).reshape(len(n_levels), -1).T
+
+def profile_index(codes, n_levels):
+    # row of a level combination in enumerate_profiles order: a mixed-radix number
+    return np.ravel_multi_index(tuple(np.asarray(codes).T), n_levels)
+
+def profile_codes(rows, n_levels):
+    return np.stack(np.unravel_index(rows, n_levels), axis=-1)
+
+def design_matrix(codes, offsets, n_total_levels, dtype=np.float32):
+    rows = np.repeat(np.arange(codes.shape[0]), codes.shape[1])
+    cols = (codes.astype(np.intp) + offsets).ravel()
+    x = np.zeros((codes.shape[0], n_total_levels), dtype=dtype)
+    x[rows, cols] = 1
+    return x
+
+def profile_utilities(codes, offsets, part_worths):
+    # one part-worth gathered per attribute from the integer codes, so no dummy-coded
+    # design matrix is built; part_worths (levels,) gives (profiles,) utilities and
+    # (respondents, levels) gives (profiles, respondents)
+    # levels first, so each gather copies whole rows of respondents
+    by_level = np.ascontiguousarray(np.asarray(part_worths).T)
+    columns = codes.astype(np.intp) + offsets
+    utilities = np.zeros(codes.shape[:1] + by_level.shape[1:], dtype=by_level.dtype)
+    for j in range(columns.shape[1]):
+        utilities += by_level[columns[:, j]]
+    return utilities
+
+def logit_shares(utilities, axis=-1):
+    # softmax shifted by the max so large utilities cannot overflow exp()
+    z = utilities - utilities.max(axis=axis, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=axis, keepdims=True)
+    return z
+
+def respondent_shares(codes, offsets, part_worths, chunk_size=None, max_block=MAX_SHARE_BLOCK):
+    # logit shares per respondent over the profiles, averaged; respondents are scored
+    # chunk_size at a time (by default as many as keep the (profiles, respondents)
+    # block under max_block elements)
+    part_worths = np.asarray(part_worths, dtype=np.float32)
+    chunk_size = chunk_size or max(1, max_block // codes.shape[0])
+    shares = np.zeros(codes.shape[0], dtype=np.float64)
+    for start in range(0, part_worths.shape[0], chunk_size):
+        utilities = profile_utilities(codes, offsets, part_worths[start:start + chunk_size])
+        shares += logit_shares(utilities, axis=0).sum(axis=1)
+    return shares / part_worths.shape[0]
+
+def simulate_design_space(attributes: dict, coef: dict, respondent_part_worths=None):
+    # respondent_part_worths: optional (respondents, levels) matrix in level_index order;
+    # shares are then aggregated from individual-level logit shares
+    if not attributes:
+        raise ValueError("no attributes with levels to simulate")
+    names, levels, n_levels, offsets = level_index(attributes)
+    codes = enumerate_profiles(n_levels)
+
+    if respondent_part_worths is None:
+        utilities = profile_utilities(codes, offsets, part_worth_vector(levels, coef))
+        shares = logit_shares(utilities)
+    else:
+        utilities = profile_utilities(codes, offsets, respondent_part_worths.mean(axis=0))
+        shares = respondent_shares(codes, offsets, respondent_part_worths)
+
+    return {
+        "attributes": names,
+        "levels": levels,
+        "codes": codes,
+        "offsets": offsets,
+        "utilities": utilities,
+        "shares": shares,
+    }
+
+CHOICE_RULES = ("logit", "share_of_utility", "first_choice")
+
+def scenario_array(product_sets, levels):
+    # product_sets: one list of products per scenario, each product a list of level names;
+    # shorter scenarios are padded and marked unavailable
+    position = {level: i for i, level in enumerate(levels)}
+    n_products = max(len(products) for products in product_sets)
+    scenarios = np.zeros((len(product_sets), n_products, len(levels)), dtype=np.uint8)
+    available = np.zeros((len(product_sets), n_products), dtype=bool)
+
+    for s, products in enumerate(product_sets):
+        for p, product in enumerate(products):
+            scenarios[s, p, [position[level] for level in product]] = 1
+            available[s, p] = True
+    return scenarios, available
+
+def scenario_shares(scenarios, part_worths, rule="logit", available=None, chunk_size=None, max_block=MAX_SHARE_BLOCK):
+    # scenarios: (scenario, product, level) indicators; returns (scenario, product) shares.
+    # part_worths is (levels,) or (respondents, levels); respondent shares are averaged
+    # over chunks of chunk_size respondents (by default as many as keep each
+    # (respondents, scenarios, products) block under max_block elements)
+    if rule not in CHOICE_RULES:
+        raise ValueError(f"rule must be one of {CHOICE_RULES}, got {rule!r}")
+
+    scenarios = np.asarray(scenarios, dtype=np.float32)
+    part_worths = np.asarray(part_worths, dtype=np.float32)
+    if part_worths.ndim == 1:
+        return _shares(scenarios @ part_worths, rule, available)
+
+    # respondents with no usable utility (NaN rows) are left out of the average
+    chunk_size = chunk_size or max(1, max_block // (scenarios.shape[0] * scenarios.shape[1]))
+    total = np.zeros(scenarios.shape[:2], dtype=np.float64)
+    counted = np.zeros(scenarios.shape[:2], dtype=np.int64)
+    for start in range(0, part_worths.shape[0], chunk_size):
+        utilities = np.moveaxis(scenarios @ part_worths[start:start + chunk_size].T, -1, 0)
+        shares = _shares(utilities, rule, available)
+        total += np.nansum(shares, axis=0)
+        counted += (~np.isnan(shares)).sum(axis=0)
+    return np.divide(total, counted, out=np.full_like(total, np.nan), where=counted > 0)
+
+def _shares(utilities, rule, available):
+    if available is None:
+        available = np.ones(utilities.shape[-2:], dtype=bool)
+
+    if rule == "logit":
+        return logit_shares(np.where(available, utilities, -np.inf))
+
+    if rule == "share_of_utility":
+        # only positive utilities can be shared out proportionally
+        weights = np.where(available, np.clip(utilities, 0, None), 0)
+    else:
+        # ties split the choice equally
+        best = np.where(available, utilities, -np.inf).max(axis=-1, keepdims=True)
+        weights = (available & (utilities == best)).astype(np.float32)
+
+    total = weights.sum(axis=-1, keepdims=True)
+    return np.divide(weights, total, out=np.full_like(weights, np.nan), where=total > 0)
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import bootstrap
+from bootstrap import bootstrap_part_worths, share_interval
+
+
+def ratings_frame(n_respondents=30, n_tasks=8, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n_respondents * n_tasks, 3))
+    df = pd.DataFrame(x, columns=["x1", "x2", "x3"])
+    df["respondent"] = np.repeat(np.arange(n_respondents), n_tasks)
+    df["rating"] = x @ np.array([1.0, -0.5, 0.25]) + rng.normal(size=len(df))
+    return df
+
+
+def test_respondent_bootstrap_matches_refitting_resampled_data():
+    df = ratings_frame()
+    X_cols = ["x1", "x2", "x3"]
+    draws = bootstrap_part_worths(df, X_cols, "rating", "respondent", n_replicates=150, n_jobs=1, seed=3)
+
+    # replay the multinomial respondent counts of every batch and refit on the resampled rows
+    sizes = [bootstrap.BATCH_SIZE, 150 - bootstrap.BATCH_SIZE]
+    seeds = np.random.SeedSequence(3).spawn(len(sizes))
+    counts = np.concatenate([np.random.default_rng(seed).multinomial(30, np.full(30, 1 / 30), size=size)
+                             for seed, size in zip(seeds, sizes)])
+    for replicate, respondent_counts in enumerate(counts):
+        sample = df.loc[np.repeat(df.index, respondent_counts[df["respondent"]])]
+        expected = np.linalg.lstsq(sample[X_cols].to_numpy(), sample["rating"].to_numpy(), rcond=None)[0]
+        np.testing.assert_allclose(draws[replicate], expected, rtol=1e-8, atol=1e-10)
+
+def test_row_bootstrap_matches_one_row_per_respondent():
+    df = ratings_frame().drop(columns="respondent")
+    df["row"] = np.arange(len(df))
+    X_cols = ["x1", "x2", "x3"]
+    original = bootstrap.ROW_CHUNK_ELEMENTS
+    try:
+        # several row chunks, so the binomial split of the draws is exercised
+        bootstrap.ROW_CHUNK_ELEMENTS = 9 * 50
+        rows = bootstrap_part_worths(df, X_cols, "rating", n_replicates=2000, n_jobs=1, seed=0)
+    finally:
+        bootstrap.ROW_CHUNK_ELEMENTS = original
+    respondents = bootstrap_part_worths(df, X_cols, "rating", "row", n_replicates=2000, n_jobs=1, seed=1)
+
+    np.testing.assert_allclose(rows.mean(axis=0), respondents.mean(axis=0), atol=0.01)
+    np.testing.assert_allclose(rows.std(axis=0), respondents.std(axis=0), rtol=0.1)
+
+def test_share_interval_matches_full_softmax():
+    rng = np.random.default_rng(0)
+    draws = rng.normal(size=(200, 4))
+    design = (rng.random((25, 4)) < 0.5).astype(np.uint8)
+    lower, upper = share_interval(draws, list("abcd"), list("abcd"), design, chunk_size=7)
+
+    utilities = draws @ design.T
+    shares = np.exp(utilities - utilities.max(axis=1, keepdims=True))
+    shares /= shares.sum(axis=1, keepdims=True)
+    np.testing.assert_allclose(lower, np.percentile(shares, 2.5, axis=0), rtol=1e-4)
+    np.testing.assert_allclose(upper, np.percentile(shares, 97.5, axis=0), rtol=1e-4)
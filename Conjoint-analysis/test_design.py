@@ -0,0 +1,27 @@
+import itertools
+
+import numpy as np
+
+from design import _sherman_morrison, d_efficiency, generate_design, model_matrix
+
+
+def test_sherman_morrison_matches_inverse():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(12, 4))
+    m = x.T @ x
+    row = rng.normal(size=4)
+    np.testing.assert_allclose(_sherman_morrison(np.linalg.inv(m), row, 1), np.linalg.inv(m + np.outer(row, row)))
+    np.testing.assert_allclose(_sherman_morrison(np.linalg.inv(m), x[0], -1), np.linalg.inv(m - np.outer(x[0], x[0])))
+
+def test_coordinate_exchange_finds_the_best_small_design():
+    # every 6-run multiset of the 2 x 2 x 3 factorial, scored directly
+    attributes = {"a": ["a0", "a1"], "b": ["b0", "b1"], "c": ["c0", "c1", "c2"]}
+    n_levels = [2, 2, 3]
+    profiles = np.array(list(itertools.product(*(range(n) for n in n_levels))))
+    best = max(d_efficiency(profiles[list(runs)], n_levels)
+               for runs in itertools.combinations_with_replacement(range(len(profiles)), 6))
+
+    codes, efficiency = generate_design(attributes, 6, seed=0)
+    assert np.isclose(efficiency, best)
+    assert np.isclose(efficiency, d_efficiency(codes, n_levels))
+    assert model_matrix(codes, n_levels).shape == (6, 5)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from scipy import optimize, special
+
+from estimation import fit_mnl, respondent_part_worths
+
+
+def ratings_frame(n_respondents=20, n_levels=5, seed=0):
+    # unequal task counts per respondent, rows shuffled across respondents
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(n_levels + 1, 3 * n_levels, n_respondents)
+    respondent = np.repeat(np.arange(100, 100 + n_respondents), counts)
+    x = rng.normal(size=(len(respondent), n_levels))
+    df = pd.DataFrame(x, columns=[f"level_{j}" for j in range(n_levels)])
+    df["respondent"] = respondent
+    df["rating"] = x @ rng.normal(size=n_levels) + rng.normal(size=len(df))
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def choice_frame(n_tasks=400, n_alternatives=3, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n_tasks, n_alternatives, 3))
+    utilities = x @ np.array([1.0, -0.5, 0.25]) + rng.gumbel(size=(n_tasks, n_alternatives))
+    chosen = (utilities == utilities.max(axis=1, keepdims=True)).astype(int)
+    df = pd.DataFrame(x.reshape(-1, 3), columns=["x1", "x2", "x3"])
+    df["task"] = np.repeat(np.arange(n_tasks), n_alternatives)
+    df["choice"] = chosen.ravel()
+    return df
+
+
+def test_batched_ols_matches_per_respondent_lstsq():
+    df = ratings_frame()
+    X_cols = [col for col in df if col.startswith("level_")]
+    estimate = respondent_part_worths(df, "respondent", X_cols, "rating", shrinkage=False)
+
+    for i, respondent in enumerate(estimate["respondents"]):
+        rows = df[df["respondent"] == respondent]
+        expected = np.linalg.lstsq(rows[X_cols].to_numpy(), rows["rating"].to_numpy(), rcond=None)[0]
+        np.testing.assert_allclose(estimate["part_worths"][i], expected, rtol=1e-4, atol=1e-5)
+
+def test_mnl_matches_direct_likelihood_maximization():
+    df = choice_frame()
+    model = fit_mnl(df, "task", ["x1", "x2", "x3"], "choice")
+
+    x = df[["x1", "x2", "x3"]].to_numpy().reshape(-1, 3, 3)
+    chosen = df["choice"].to_numpy().reshape(-1, 3)
+
+    def negative_loglike(beta):
+        utilities = x @ beta
+        return -(chosen * (utilities - special.logsumexp(utilities, axis=1, keepdims=True))).sum()
+
+    reference = optimize.minimize(negative_loglike, np.zeros(3), method="BFGS", options={"gtol": 1e-8})
+    np.testing.assert_allclose(model.params.to_numpy(), reference.x, atol=1e-4)
+    np.testing.assert_allclose(model.llf, -reference.fun, rtol=1e-8)
+    np.testing.assert_allclose(model.bse.to_numpy(), np.sqrt(np.diag(reference.hess_inv)), rtol=0.1)
@@ -0,0 +1,49 @@
+import itertools
+
+import numpy as np
+
+from optimizer import beam_search_line, exhaustive_line, optimize_product_line, top_k_profiles
+from simulation import design_matrix
+
+
+N_LEVELS = np.array([3, 2, 4])
+OFFSETS = np.concatenate([[0], np.cumsum(N_LEVELS)[:-1]])
+
+
+def all_profiles():
+    return np.array(list(itertools.product(*(range(n) for n in N_LEVELS))))
+
+def brute_force_line(part_worths, candidates, competitors, n_products):
+    # logit share of every line against the competitors, averaged over respondents
+    def share(line):
+        own = np.exp(part_worths @ candidates[list(line)].T).sum(axis=1)
+        return (own / (own + np.exp(part_worths @ competitors.T).sum(axis=1))).mean()
+    return max(itertools.combinations(range(len(candidates)), n_products), key=share)
+
+
+def test_top_k_profiles_matches_sorting_every_profile():
+    part_worths = np.random.default_rng(0).normal(size=N_LEVELS.sum())
+    profiles = all_profiles()
+    utilities = part_worths[profiles + OFFSETS].sum(axis=1)
+
+    codes, found = top_k_profiles(part_worths, N_LEVELS, OFFSETS, k=10)
+    np.testing.assert_allclose(found, np.sort(utilities)[::-1][:10])
+    np.testing.assert_allclose(part_worths[codes + OFFSETS].sum(axis=1), found)
+
+def test_line_search_matches_brute_force():
+    rng = np.random.default_rng(1)
+    part_worths = rng.normal(size=(40, N_LEVELS.sum()))
+    candidates = design_matrix(all_profiles(), OFFSETS, int(N_LEVELS.sum()))
+    competitors = candidates[rng.choice(len(candidates), 2, replace=False)]
+
+    expected = brute_force_line(part_worths, candidates, competitors, 3)
+    line, share = exhaustive_line(part_worths, candidates, competitors, 3, n_jobs=1)
+    assert tuple(line) == expected
+    beam_line, beam_share = beam_search_line(part_worths, candidates, competitors, 3, beam_width=len(candidates) ** 2)
+    assert np.isclose(beam_share, share)
+
+def test_product_line_is_capped_at_the_design_space():
+    part_worths = np.random.default_rng(2).normal(size=(10, N_LEVELS.sum()))
+    competitors = design_matrix(all_profiles()[:1], OFFSETS, int(N_LEVELS.sum()))
+    codes, share = optimize_product_line(part_worths, N_LEVELS, OFFSETS, competitors, 50, n_jobs=1)
+    assert len(codes) == len(all_profiles())
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from simulation import CHOICE_RULES, scenario_shares
+
+
+@pytest.mark.parametrize("rule", CHOICE_RULES)
+def test_scenario_shares_do_not_depend_on_the_respondent_chunk(rule):
+    rng = np.random.default_rng(0)
+    scenarios = (rng.random((50, 4, 12)) < 0.4).astype(np.uint8)
+    part_worths = rng.normal(size=(300, 12))
+
+    whole = scenario_shares(scenarios, part_worths, rule, chunk_size=300)
+    np.testing.assert_allclose(scenario_shares(scenarios, part_worths, rule, chunk_size=7), whole, atol=1e-6)
+    np.testing.assert_allclose(scenario_shares(scenarios, part_worths, rule, max_block=1_000), whole, atol=1e-6)
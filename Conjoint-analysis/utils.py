@@ -1,17 +1,38 @@
 import numpy as np
+import os
 import pandas as pd
 import plotly.express as px
 import statsmodels.api as sm
 import streamlit as st
+import sys
 import uuid
 
+from bootstrap import N_REPLICATES, bootstrap_part_worths, importance_draws, percentile_interval, share_interval
+from design import conjoint_design
+from estimation import align_part_worths, fit_mnl, respondent_part_worths
+from optimizer import optimize_product_line, top_k_profiles
+from pricing import N_PRICE_POINTS, demand_curves, interpolate_price_utility, optimal_prices, parse_price, price_grid
+from simulation import (
+    CHOICE_RULES,
+    design_matrix,
+    level_index,
+    profile_codes,
+    profile_index,
+    scenario_shares,
+    simulate_design_space,
+)
+
+# upload reading is shared with the Factor app through ingestion.py at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingestion import read_file  # noqa: E402
+
 st.set_page_config(layout="wide")
 
 @st.cache_data
 def load_file(file_path):
     try:
-        df = pd.read_csv(file_path, index_col=0)
-        return df
+        # dummy-coded levels are stored as uint8; ratings keep their float dtype
+        return read_file(file_path, binary=True, floats=False)
     except Exception as e:
         st.session_state["file"] = False
         st.error(f"Error loading file: {e}")
@@ -21,7 +42,7 @@ def sidebar():
 
     with st.sidebar:
         st.title("Conjoint Analysis")
-        uploaded_file = st.file_uploader(label="#",type='csv')
+        uploaded_file = st.file_uploader(label="#",type=['csv','parquet','arrow','feather'])
 
         if uploaded_file is not None:
             st.session_state["file"] = True
@@ -33,7 +54,12 @@ def sidebar():
             st.session_state["file_path"] = "./data/sample_data.csv"
 
 def check_nulls(df):
-    n_nulls = df.isnull().sum().sum()
+    # load_file counts nulls while streaming; fall back to a scan otherwise
+    null_counts = df.attrs.get("null_counts")
+    if null_counts is not None:
+        n_nulls = sum(null_counts.values())
+    else:
+        n_nulls = df.isnull().sum().sum()
 
     if n_nulls != 0:
         return True
@@ -58,6 +84,7 @@ def preprocessing(df: pd.DataFrame, columns: list):
                     unsafe_allow_html=True
                     )
         df = df.dropna()
+        df.attrs.pop("null_counts", None)
 
     if columns==[]:
         st.markdown("<div class=description>All columns in the dataset are used in analysis</div>", unsafe_allow_html=True)
@@ -81,20 +108,84 @@ def preprocessing(df: pd.DataFrame, columns: list):
 
     return df
 
+# fitted models are shared read-only across reruns, keyed on the data and the X/Y choice
+@st.cache_resource(show_spinner="Fitting regression model...")
+def fit_part_worth_model(df, X_cols: tuple, Y_col: str):
+    lr = sm.OLS(df[Y_col], df[list(X_cols)]).fit()
+    return lr, lr.summary().as_text()
+
+@st.cache_resource(show_spinner="Fitting multinomial logit model...")
+def fit_choice_model(df, task_col, X_cols: tuple, Y_col: str):
+    model = fit_mnl(df, task_col, list(X_cols), Y_col)
+    return model, model.summary()
+
+@st.cache_resource(show_spinner="Estimating respondent-level part worths...")
+def fit_respondent_model(df, respondent_col, X_cols: tuple, Y_col: str, shrinkage=True):
+    return respondent_part_worths(df, respondent_col, list(X_cols), Y_col, shrinkage=shrinkage)
+
 def compute_part_worth(df, X_cols: list,Y_col: str):
-    X = df[X_cols]
-    Y = df[Y_col]
-    lr = sm.OLS(Y,X).fit()
+    lr, summary = fit_part_worth_model(df, tuple(X_cols), Y_col)
 
     st.session_state["model"] = lr
 
     with st.expander("View regression coefficient summary"):
-        st.text(lr.summary())
+        st.text(summary)
 
     coef = lr.params.to_dict()
 
     return coef
 
+def compute_choice_part_worth(df, task_col, X_cols: list, Y_col: str):
+    # choice-based data in long format: Y_col flags the chosen alternative within each task
+    model, summary = fit_choice_model(df, task_col, tuple(X_cols), Y_col)
+
+    st.session_state["model"] = model
+
+    with st.expander("View multinomial logit coefficient summary"):
+        st.text(summary)
+
+    coef = model.params.to_dict()
+
+    return coef
+
+def compute_respondent_part_worth(df, respondent_col, X_cols: list, Y_col: str, shrinkage=True):
+    # one regression per respondent, solved as a batch; the float32 matrix is kept in
+    # session_state for individual-level share simulation
+    estimate = fit_respondent_model(df, respondent_col, tuple(X_cols), Y_col, shrinkage)
+    st.session_state["respondent_model"] = estimate
+
+    with st.expander("View respondent-level part worth summary"):
+        summary = pd.DataFrame(estimate["part_worths"], columns=estimate["columns"]).describe().T
+        summary.insert(0, "population mean", estimate["population"])
+        st.dataframe(summary, use_container_width=True)
+        st.markdown(f"<div class=description>Number of respondents : <code>{len(estimate['respondents'])}</code></div>",
+                    unsafe_allow_html=True)
+
+    return estimate
+
+@st.cache_data(show_spinner="Bootstrapping part worths...")
+def bootstrap_draws(df, X_cols: tuple, Y_col: str, respondent_col=None, n_replicates=N_REPLICATES):
+    return bootstrap_part_worths(df, list(X_cols), Y_col, respondent_col, n_replicates)
+
+def add_importance_intervals(data, draws, X_cols: list, ci=95):
+    attributes = {name: levels for name, levels in zip(data["Attribute Name"], data["Attribute Levels"]) if levels}
+    lower, upper = percentile_interval(importance_draws(draws, X_cols, attributes), ci)
+    data = data.copy()
+    data.loc[data["Attribute Levels"].str.len() > 0, "Importance Lower"] = lower
+    data.loc[data["Attribute Levels"].str.len() > 0, "Importance Upper"] = upper
+    return data
+
+def add_share_intervals(df, draws, X_cols: list, ci=95):
+    levels = level_columns(df)
+    lower, upper = share_interval(draws, X_cols, levels, df[levels].to_numpy(), ci)
+    return df.assign(share_lower=lower*100, share_upper=upper*100)
+
+def part_worth_matrix(levels):
+    # respondent-level part-worths when they were estimated, else the aggregate OLS vector
+    if st.session_state.get("respondent_model") is not None:
+        return align_part_worths(st.session_state["respondent_model"], levels)
+    return st.session_state["model"].params.reindex(levels).fillna(0).to_numpy()
+
 def set_marker_color(df):
 
     colors = ["#636EFA" if x > 0 else "crimson" for x in df['part worth utility']]
@@ -140,13 +231,46 @@ def generate_attribute(row_id,df,coef):
             "coef": [coef[level] for level in attribute_levels]
             }
 
+@st.cache_data(show_spinner="Searching for a D-optimal design...")
+def make_design(attributes: dict, n_runs: int, n_alternatives=None):
+    return conjoint_design(attributes, n_runs, n_alternatives)
+
+def design_generator(data):
+    # a new survey design over the attributes defined above, in the same dummy-coded layout
+    attributes = {name: levels for name, levels in zip(data["Attribute Name"], data["Attribute Levels"]) if levels}
+    if not attributes:
+        return None
+    n_params = 1 + sum(len(levels) - 1 for levels in attributes.values())
+
+    cols = st.columns(3)
+    with cols[0]:
+        n_runs = st.number_input("Number of runs (choice tasks)", min_value=n_params, value=2*n_params)
+    with cols[1]:
+        st.write("######")
+        choice = st.checkbox("Choice design")
+    with cols[2]:
+        n_alternatives = st.number_input("Alternatives per task", min_value=2, max_value=6, value=3, disabled=not choice)
+
+    design, efficiency = make_design(attributes, n_runs, n_alternatives if choice else None)
+    st.dataframe(design, use_container_width=True)
+    st.markdown(f"<div class=description>D-efficiency : <code>{efficiency:.4f}</code></div>", unsafe_allow_html=True)
+    st.download_button("Download design (CSV)", design.to_csv().encode("utf-8"),
+                       file_name="conjoint_design.csv", mime="text/csv")
+    return design
+
 def plot_relative_importance(df):
+    # bootstrap intervals are drawn as error bars when add_importance_intervals was applied
+    error = {}
+    if "Importance Upper" in df:
+        error = {"error_y": df["Importance Upper"] - df["Relative Importance"],
+                 "error_y_minus": df["Relative Importance"] - df["Importance Lower"]}
     fig = px.bar(df,
                  x= "Attribute Name",
                  y = "Relative Importance",
                  color="Attribute Name",
                  text_auto=".2f",
-                 title="Relative Importance of Attributes"
+                 title="Relative Importance of Attributes",
+                 **error
                 )
 
     fig.update_traces(textfont_size=13, textangle=0, textposition="outside", cliponaxis=False)
@@ -180,62 +304,74 @@ def predict_total_utility_score(df1,df2):
     model = st.session_state["model"]
     return model.predict(option)[0], _attribute_levels
 
-def market_share_simulation(df, price_levels):
-    df_logit = df.copy()
-    for level in price_levels:
-        df_logit[level] = 0
-
-    dependent_variable = st.session_state["Y"]
-    df_logit = df_logit.drop([dependent_variable],axis=1)
-    X = df_logit
-    model = st.session_state["model"]
-    predictUtil = model.predict(X)
-    df_logit.loc[:,"predicted_Utility"] = predictUtil
-
-    utility_values = list(predictUtil)
-    total_utility = 0
-    for val in utility_values:
-        total_utility += np.exp(val)
-    market_shares = []
-    for val in utility_values:
-        probability = np.exp(val)/total_utility
-        market_shares.append(probability*100)
-
-    df_logit.loc[:,"market_share"] = market_shares
-    df_logit = df_logit.drop(price_levels, axis=1)
-    df_logit = df_logit.drop_duplicates()
-
+@st.cache_data(show_spinner="Simulating market shares...")
+def simulate_market(attributes: dict, coef: dict, respondent_estimate=None):
+    respondent = None
+    if respondent_estimate is not None:
+        respondent = align_part_worths(respondent_estimate, level_index(attributes)[1])
+    result = simulate_design_space(attributes, coef, respondent)
+
+    # the level columns are only built for the table, as uint8 indicators
+    design = design_matrix(result["codes"], result["offsets"], len(result["levels"]), dtype=np.uint8)
+    df_logit = pd.DataFrame(design, columns=result["levels"])
+    df_logit.loc[:,"predicted_Utility"] = result["utilities"]
+    df_logit.loc[:,"market_share"] = result["shares"]*100
     df_logit.loc[:,"product name"] = [f"Product_{i+1}" for i in range(len(df_logit))]
+    # rows follow enumerate_profiles order, so lookups can go through profile_index
+    df_logit.attrs["attributes"] = attributes
 
     return df_logit
 
+def market_share_simulation(data, price_attribute, coef):
+    # price is held out of the bundle utilities; every combination of the
+    # remaining attribute levels is scored, not only the rows of the survey design
+    attributes = {name: levels for name, levels in zip(data["Attribute Name"], data["Attribute Levels"])
+                  if name != price_attribute and levels}
+    if not attributes:
+        st.warning("Define at least one attribute besides the price column to simulate market shares", icon="⚠️")
+        return None
+    return simulate_market(attributes, coef, st.session_state.get("respondent_model"))
+
+def product_row(df, selected: dict):
+    # row of a level combination without scanning df; None if it is not in the design space
+    attributes = df.attrs["attributes"]
+    try:
+        codes = [attributes[name].index(selected[name]) for name in attributes]
+    except (KeyError, ValueError):
+        return None
+    return int(profile_index(codes, [len(levels) for levels in attributes.values()]))
+
+def product_levels(df, row):
+    attributes = df.attrs["attributes"]
+    codes = profile_codes(row, [len(levels) for levels in attributes.values()])
+    return [levels[c] for levels, c in zip(attributes.values(), codes)]
+
 def generate_level_selectbox(df:pd.DataFrame,attributes:dict, n_rows:int):
     row_names = [f'rows_{j}' for j in range(n_rows)]
     _rows = []
-    user_choice = []
+    user_choice = {}
     for row_name in row_names:
         row_name = st.columns(4)
         _rows.append(row_name)
     _rows = [_r for _row in _rows for _r in _row]
     for _r, (attr, level) in zip(_rows, attributes.items()):
-        user_choice.append(_r.selectbox(f"Select a level of attribute: {attr}",level))
+        user_choice[attr] = _r.selectbox(f"Select a level of attribute: {attr}",level)
 
-    if all(user_choice):
+    if all(user_choice.values()):
 
-        query = ' & '.join([f"{value} == 1" for value in user_choice])
-        filtered_df = df.query(query)
+        row = product_row(df, user_choice)
 
-        if not filtered_df.empty:
+        if row is not None:
             cols = st.columns(3)
             with cols[1]:
                 container = st.container(border=True)
                 with container:
                     st.markdown(f"""<p style ='font-size:1.2em;font-weight:bold;text-align:center;'>
-                                Prodcut Name : {filtered_df["product name"].values[0]}%</p>""",
+                                Prodcut Name : {df["product name"].iat[row]}</p>""",
                                 unsafe_allow_html=True)
 
                     st.markdown(f"""<p style ='font-size:1.2em;font-weight:bold;text-align:center;'>
-                                Market Share : {filtered_df["market_share"].values[0]:.4f}%</p>""",
+                                Market Share : {df["market_share"].iat[row]:.4f}%</p>""",
                                 unsafe_allow_html=True)
 
         else:
@@ -243,30 +379,171 @@ def generate_level_selectbox(df:pd.DataFrame,attributes:dict, n_rows:int):
 
 def extract_attribute_level_by_id(df):
 
-    remove_cols_list = ['market_share','predicted_Utility']
-    keep_cols = [item for item in df.columns.to_list() if item not in remove_cols_list]
+    product_id = st.selectbox('Select a product ID:', df["product name"])
+    # product names are numbered in row order
+    row = int(product_id.rsplit("_", 1)[1]) - 1
+    levels = product_levels(df, row)
 
-    df.loc[:,"product name"] = [f"Product_{i+1}" for i in range(len(df))]
-    df = df.sort_values('market_share', ascending=True)
-
-    product_id = st.selectbox('Select a product ID:', sorted(df["product name"].tolist()))
-    levels = [col for col in keep_cols if not df[(df["product name"]==product_id)&(df[col] ==1)].empty]
-
-    # st.dataframe(df[df["product name"]==product_id])
     st.markdown(f"Attribute Levels with {product_id}:")
     st.code(levels)
     container = st.container(border=True)
     container.markdown(f"""<p style ='font-size:1.2em;font-weight:bold;'>Market Share :
-            {df[df["product name"]==product_id]["market_share"].values[0]:.4f}%</p>""",
+            {df["market_share"].iat[row]:.4f}%</p>""",
             unsafe_allow_html=True)
 
-def plot_market_share(df):
+def select_competitors(df):
+    cols = st.columns([2,1])
+    with cols[0]:
+        competitors = st.multiselect("Select competitor products", df["product name"].tolist())
+    with cols[1]:
+        rule = st.radio("Choice rule", CHOICE_RULES, format_func=lambda x: x.replace("_", " ").capitalize(), horizontal=True)
+    return competitors, rule
+
+def level_columns(df):
+    return [level for levels in df.attrs["attributes"].values() for level in levels]
+
+def competitive_scenarios(df, competitors, rule):
+    # every product in the design space is tried as "our product" against the same
+    # competitor set; all candidates are scored in one scenario_shares call
+    if not competitors:
+        st.info("Select competitor products to compare every candidate product against them")
+        return None
+
+    levels = level_columns(df)
+    part_worths = part_worth_matrix(levels)
+    design = df[levels].to_numpy(dtype=np.uint8)
+    competitor_design = design[df["product name"].isin(competitors).to_numpy()]
+    n_candidates, n_levels = design.shape
+    scenarios = np.concatenate([
+        design[:, None, :],
+        np.broadcast_to(competitor_design, (n_candidates, *competitor_design.shape)),
+    ], axis=1)
+
+    shares = scenario_shares(scenarios, part_worths, rule)
+
+    result = pd.DataFrame({
+        "product name": df["product name"].to_numpy(),
+        "share vs competitors": shares[:, 0]*100,
+        "best competitor share": shares[:, 1:].max(axis=1)*100,
+    }).sort_values("share vs competitors", ascending=False)
+    st.dataframe(result.head(20), hide_index=True, use_container_width=True)
+
+    return result
+
+# reruns with the same inputs reuse the result instead of starting a new process pool
+@st.cache_data(show_spinner="Optimizing the product line...")
+def best_product_line(part_worths, n_levels, offsets, competitor_design, n_products: int):
+    return optimize_product_line(part_worths, n_levels, offsets, competitor_design, n_products)
+
+def product_line_optimizer(df, attributes, competitors):
+    # searches the attribute design space directly, so it also works when the space
+    # is far too large to enumerate in df
+    names, levels, n_levels, offsets = level_index(attributes)
+    part_worths = part_worth_matrix(levels)
+
+    cols = st.columns(2)
+    with cols[0]:
+        k = st.number_input("Number of top bundles", min_value=1, max_value=100, value=10)
+        codes, utilities = top_k_profiles(np.atleast_2d(part_worths).mean(axis=0), n_levels, offsets, k)
+        top_bundles = pd.DataFrame([[attributes[name][c] for name, c in zip(names, row)] for row in codes], columns=names)
+        top_bundles["predicted_Utility"] = utilities
+        st.dataframe(top_bundles, hide_index=True, use_container_width=True)
+    with cols[1]:
+        max_products = int(min(5, np.prod(n_levels)))
+        n_products = st.number_input("Number of products in the line", min_value=1, max_value=max_products,
+                                     value=min(2, max_products))
+        if not competitors:
+            st.info("Select competitor products to optimize a product line against them")
+            return
+        competitor_design = df.loc[df["product name"].isin(competitors), levels].to_numpy(dtype=np.float64)
+        line, share = best_product_line(part_worths, n_levels, offsets, competitor_design, n_products)
+        st.dataframe(pd.DataFrame([[attributes[name][c] for name, c in zip(names, row)] for row in line], columns=names),
+                     hide_index=True, use_container_width=True)
+        st.markdown(f"<div class=description>Combined share of the line : <code>{share*100:.2f}%</code></div>", unsafe_allow_html=True)
+
+def price_sensitivity(df, price_levels, competitors):
+    # demand and revenue over a dense price grid for the leading products at once;
+    # price part-worths are interpolated between the tested price levels
+    prices = [parse_price(level) for level in price_levels]
+    if len(prices) < 2 or None in prices or len(set(prices)) < len(prices):
+        st.info("Price levels need distinct numbers in their names (e.g. Price50) to build demand curves")
+        return None
+    if not competitors:
+        # the part-worths have no none option, so without competitors a share would only be
+        # measured against the reference levels of the dummy coding
+        st.info("Select competitor products to build demand curves: shares are relative to the competitor set")
+        return None
+
+    levels = level_columns(df)
+    part_worths = np.atleast_2d(part_worth_matrix(levels + list(price_levels)))
+    product_part_worths, price_part_worths = part_worths[:, :len(levels)], part_worths[:, len(levels):]
+
+    cols = st.columns(4)
+    with cols[0]:
+        n_products = st.number_input("Number of products by market share", min_value=1, max_value=len(df), value=min(100, len(df)))
+    with cols[1]:
+        n_points = st.number_input("Price points", min_value=10, max_value=5000, value=N_PRICE_POINTS, step=10)
+    with cols[2]:
+        competitor_price = st.number_input("Competitor price", min_value=min(prices), max_value=max(prices), value=float(np.median(prices)))
+    with cols[3]:
+        unit_cost = st.number_input("Unit cost", min_value=0.0, value=0.0)
+
+    products = df.nlargest(n_products, "market_share")
+    grid = price_grid(prices, n_points)
+    price_utilities = interpolate_price_utility(prices, price_part_worths, grid)
+    product_utilities = product_part_worths @ products[levels].to_numpy(dtype=np.float64).T
+
+    competitor_design = df.loc[df["product name"].isin(competitors), levels].to_numpy(dtype=np.float64)
+    competitor_utilities = (product_part_worths @ competitor_design.T
+                            + interpolate_price_utility(prices, price_part_worths, [competitor_price]))
+
+    demand = demand_curves(product_utilities, price_utilities, competitor_utilities)
+    result = optimal_prices(grid, demand, unit_cost)
+
+    table = pd.DataFrame({
+        "product name": products["product name"].to_numpy(),
+        "optimal price": result["optimal_price"],
+        "share at optimal price": result["optimal_share"]*100,
+        "revenue per customer": result["optimal_revenue"],
+    }).sort_values("revenue per customer", ascending=False)
+
+    cols = st.columns([1,2])
+    with cols[0]:
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        st.markdown("<div class=description>Shares are each product's logit share against the selected competitors at the competitor price, not absolute demand</div>",
+                    unsafe_allow_html=True)
+    with cols[1]:
+        top = table.index[:5]
+        st.plotly_chart(plot_price_curves(grid, demand[:, top], result["revenue"][:, top],
+                                          products["product name"].to_numpy()[top]))
+
+    return table
+
+def plot_price_curves(grid, demand, revenue, names):
+    curves = pd.concat([
+        pd.DataFrame({"price": np.tile(grid, len(names)), "product name": np.repeat(names, len(grid)),
+                      "metric": metric, "value": values.T.ravel()})
+        for metric, values in (("demand (%)", demand*100), ("revenue per customer", revenue))
+    ])
+    fig = px.line(curves, x="price", y="value", color="product name", facet_row="metric",
+                  title="Demand and revenue curves")
+    fig.update_yaxes(matches=None, title="")
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+    return fig
+
+def plot_market_share(df, top_n=30):
 
-    fig = px.bar(df.sort_values("market_share",ascending=True),
+    top = df.nlargest(top_n, "market_share").sort_values("market_share",ascending=True)
+    error = {}
+    if "share_upper" in top:
+        error = {"error_y": top["share_upper"] - top["market_share"],
+                 "error_y_minus": top["market_share"] - top["share_lower"]}
+    fig = px.bar(top,
                  y="market_share",
                  x = "product name",
                  text_auto=".2f",
-                 title='Estimated Market Share')
+                 title=f'Estimated Market Share (top {top_n} products)' if len(df) > top_n else 'Estimated Market Share',
+                 **error)
     fig.update_traces(textfont_size=13, textangle=0, textposition="outside", cliponaxis=False)
     fig.update_layout(xaxis_title="Product Name", yaxis_title="Market Sahre (%)",showlegend=False)
 
@@ -1,18 +1,29 @@
 import streamlit as st
-import pandas as pd
+
+from retention import parallel_analysis, bootstrap_eigenvalues
 
 from utils import (
     sidebar,
     load_file,
     check_nulls,
     preprocessing,
+    load_preview,
+    streaming_preprocessing,
+    data_fingerprint,
+    file_fingerprint,
+    cached,
+    correlation_stats,
+    streaming_stats,
+    adequacy_results,
     adequacy_test,
     fit_factor_analyzer,
     scree_plot,
     determine_n_factors,
     highlight_cells,
     high_loading_factors,
+    loadings_frame,
     factor_analysis_summary,
+    export_factor_model,
     factor_loading_plot
 )
 
@@ -44,12 +55,21 @@ else:
 ###1. Data Table###
 st.header('1. Data Table')
 
-df=load_file(st.session_state["file_path"])
+streaming = st.session_state["streaming"]
+
+if streaming:
+    # only a preview is held in memory; the analysis streams the whole file
+    df=load_preview(st.session_state["file_path"])
+else:
+    df=load_file(st.session_state["file_path"])
 
 with st.expander("View DataFrame"):
     st.dataframe(df)
 
-st.markdown(f"<div class=description>DataFrame shape : <code>{df.shape}</code></div>", unsafe_allow_html=True)
+if streaming:
+    st.markdown(f"<div class=description>Previewing the first <code>{len(df)}</code> rows of the file</div>", unsafe_allow_html=True)
+else:
+    st.markdown(f"<div class=description>DataFrame shape : <code>{df.shape}</code></div>", unsafe_allow_html=True)
 
 
 ###2. Preprocessing Data###
@@ -67,13 +87,14 @@ st.markdown("""
             </div>""",
             unsafe_allow_html=True)
 
-st.subheader("Check Missing Value Handling")
-st.markdown(f"""
-                <div class=description>
-                    Does the dataset contain missing values? : <code>{check_nulls(df)}</code>
-                </div>
-            """,
-            unsafe_allow_html=True)
+if not streaming:
+    st.subheader("Check Missing Value Handling")
+    st.markdown(f"""
+                    <div class=description>
+                        Does the dataset contain missing values? : <code>{check_nulls(df)}</code>
+                    </div>
+                """,
+                unsafe_allow_html=True)
 
 st.subheader("Select columns to be removed from analysis", help='Leave this empty if all columns are used in analysis')
 
@@ -93,7 +114,14 @@ if len(st.session_state.options) != 0:
 else:
     pass
 
-df=preprocessing(df, options)
+if streaming:
+    fingerprint = file_fingerprint(st.session_state["file_path"])
+    stats = cached(streaming_stats, fingerprint, options, None, st.session_state["file_path"], tuple(options))
+    streaming_preprocessing(stats, options)
+else:
+    df=preprocessing(df, options)
+    fingerprint = data_fingerprint(df)
+    stats = cached(correlation_stats, fingerprint, options, None, df)
 
 ###3. Adequacy Test###
 st.header("3. Adequacy Test",divider="grey")
@@ -117,7 +145,7 @@ with st.popover("Explaination for Adequacy Test"):
                 unsafe_allow_html=True)
 st.write("")
 
-adequacy_test(df)
+adequacy_test(cached(adequacy_results, fingerprint, options, None, stats))
 
 
 ###4. select factors###
@@ -129,12 +157,24 @@ else:
 
 n_factors_description = "select the number of factors to be equal to the number of eigenvalues greater than or equal to one[]"
 st.header("4. Select the number of factors", divider='grey',help=n_factors_description)
-fa = fit_factor_analyzer(df, n_factors=25)
-ev, v = fa.get_eigenvalues()
+ev = stats["eigenvalues"]
 
-scree_plot(df, ev)
-st.info(n_factors_description)
-n_factors_scree = determine_n_factors(ev)
+retention_rules = ["Eigenvalue > 1", "Parallel analysis"] if streaming else ["Eigenvalue > 1", "Parallel analysis", "Bootstrap CI"]
+retention_rule = st.radio("Retention rule", retention_rules, horizontal=True,
+                          help="Parallel analysis keeps factors whose eigenvalue exceeds the 95th percentile of eigenvalues from random data of the same size. Bootstrap CI keeps factors whose lower 95% bound exceeds one.")
+n_replicates = 500
+
+if retention_rule == "Parallel analysis":
+    reference = cached(parallel_analysis, fingerprint, options, (n_replicates, 95), stats["n_obs"], len(ev), n_replicates, 95)
+elif retention_rule == "Bootstrap CI":
+    reference = cached(bootstrap_eigenvalues, fingerprint, options, (n_replicates, 95), df.to_numpy(), n_replicates, 95)
+else:
+    reference = None
+
+scree_plot(ev, reference)
+if reference is None:
+    st.info(n_factors_description)
+n_factors_scree = determine_n_factors(ev, reference)
 
 cols = st.columns(2)
 with cols[0]:
@@ -156,18 +196,21 @@ with cols[1]:
 st.header("5. Factor Analysis",divider="grey")
 st.write("####")
 
-fa = fit_factor_analyzer(df, n_factors=n_factors,rotation='varimax')
+rotation = 'varimax'
+fa = cached(fit_factor_analyzer, fingerprint, options, (n_factors, rotation), stats, n_factors, rotation)
 
-cols = [f'Factor{x}' for x in range(1,n_factors+1)]
-df_factor = pd.DataFrame(data=fa.loadings_, index=df.columns, columns=cols)
+df_factor = loadings_frame(fa, stats["columns"])
+cols = df_factor.columns.tolist()
 
 with st.expander("View the DataFrame"):
-    st.dataframe(df_factor.style.map(highlight_cells))
+    st.dataframe(df_factor.style.apply(highlight_cells, axis=None))
 
 high_loading_factors(df_factor)
 
 st.subheader("Summary Table")
-st.dataframe(factor_analysis_summary(fa,cols))
+st.dataframe(cached(factor_analysis_summary, fingerprint, options, (n_factors, rotation), fa, cols))
+
+export_factor_model(fa, stats, None if streaming else df)
 
 st.write()
 
@@ -0,0 +1,144 @@
+"""Run the factor analysis pipeline over a directory of survey files.
+
+    python batch.py surveys/ results/ --drop gender education age --workers 8
+
+For every input file the runner writes <name>_loadings.csv, <name>_variance.csv
+and <name>_adequacy.csv to the output directory, plus a batch_summary.csv with
+one row per file (adequacy statistics, number of factors, timings, errors).
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from core import (
+    COLUMNAR_SUFFIXES,
+    read_file,
+    preprocess,
+    correlation_stats,
+    streaming_stats,
+    adequacy_results,
+    is_adequate,
+    fit_factor_analyzer,
+    determine_n_factors,
+    loadings_frame,
+    factor_analysis_summary,
+)
+from retention import parallel_analysis
+
+
+def find_files(input_dir, pattern=None):
+    if pattern is not None:
+        return sorted(glob.glob(os.path.join(input_dir, pattern)))
+    suffixes = (".csv",) + COLUMNAR_SUFFIXES
+    return sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir)
+                  if name.lower().endswith(suffixes))
+
+def analyze_file(file_path, output_dir, drop_columns=(), n_factors=None, rotation="varimax",
+                 retention="kaiser", streaming=False):
+    timings = {}
+    start = time.perf_counter()
+
+    if streaming:
+        stats = streaming_stats(file_path, drop_columns)
+    else:
+        df = read_file(file_path)
+        data = preprocess(df, list(drop_columns))
+        stats = correlation_stats(data)
+        # preprocess already removed the incomplete rows, so count them here
+        stats["n_dropped"] = len(df) - len(data)
+    timings["stats_seconds"] = time.perf_counter() - start
+
+    step = time.perf_counter()
+    results = adequacy_results(stats)
+
+    if n_factors is None:
+        reference = None
+        if retention == "parallel":
+            # the batch already uses one process per file
+            reference = parallel_analysis(stats["n_obs"], len(stats["columns"]), n_jobs=1)
+        n_factors = max(determine_n_factors(stats["eigenvalues"], reference), 1)
+
+    fa = fit_factor_analyzer(stats, n_factors, rotation)
+    loadings = loadings_frame(fa, stats["columns"])
+    variance = factor_analysis_summary(fa, loadings.columns)
+    timings["fit_seconds"] = time.perf_counter() - step
+
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    loadings.to_csv(os.path.join(output_dir, f"{name}_loadings.csv"))
+    variance.to_csv(os.path.join(output_dir, f"{name}_variance.csv"))
+    pd.DataFrame({"kmo": results["kmo_all"]}, index=stats["columns"]).to_csv(
+        os.path.join(output_dir, f"{name}_adequacy.csv"))
+    timings["total_seconds"] = time.perf_counter() - start
+
+    return {
+        "file": file_path,
+        "n_obs": stats["n_obs"],
+        "n_dropped": stats["n_dropped"],
+        "n_variables": len(stats["columns"]),
+        "n_factors": n_factors,
+        "chi_square_value": results["chi_square_value"],
+        "p_value": results["p_value"],
+        "kmo_model": results["kmo_model"],
+        "adequate": is_adequate(results),
+        **timings,
+        "error": None,
+    }
+
+def _analyze_safely(file_path, *args):
+    start = time.perf_counter()
+    try:
+        return analyze_file(file_path, *args)
+    except Exception as e:
+        return {"file": file_path, "total_seconds": time.perf_counter() - start,
+                "error": f"{type(e).__name__}: {e}"}
+
+def run_batch(files, output_dir, drop_columns=(), n_factors=None, rotation="varimax",
+              retention="kaiser", streaming=False, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    args = (output_dir, tuple(drop_columns), n_factors, rotation, retention, streaming)
+    rows = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_analyze_safely, file_path, *args) for file_path in files]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            status = "failed: " + row["error"] if row["error"] else f"{row['n_factors']} factors"
+            print(f"{row['file']}: {status} ({row['total_seconds']:.2f}s)", flush=True)
+
+    summary = pd.DataFrame(rows).sort_values("file")
+    summary.to_csv(os.path.join(output_dir, "batch_summary.csv"), index=False)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch factor analysis over a directory of survey files")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--pattern", default=None, help="glob pattern inside input_dir (default: csv/parquet/arrow files)")
+    parser.add_argument("--drop", nargs="*", default=[], help="columns removed from the analysis")
+    parser.add_argument("--n-factors", type=int, default=None, help="fixed number of factors (default: use --retention)")
+    parser.add_argument("--retention", choices=["kaiser", "parallel"], default="kaiser")
+    parser.add_argument("--rotation", default="varimax")
+    parser.add_argument("--streaming", action="store_true", help="accumulate statistics chunk by chunk instead of loading each file")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    files = find_files(args.input_dir, args.pattern)
+    if not files:
+        parser.error(f"no input files found in {args.input_dir}")
+
+    start = time.perf_counter()
+    summary = run_batch(files, args.output_dir, args.drop, args.n_factors,
+                        None if args.rotation == "none" else args.rotation,
+                        args.retention, args.streaming, args.workers)
+    n_failed = summary["error"].notna().sum()
+    print(f"{len(files) - n_failed}/{len(files)} files analyzed in {time.perf_counter() - start:.2f}s")
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
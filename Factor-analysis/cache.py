@@ -0,0 +1,148 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+CACHE_DIR = ".fa_cache"
+MAX_MEMORY_BYTES = 256 * 1024**2
+MAX_DISK_BYTES = 2 * 1024**3
+
+
+def dataset_fingerprint(df: pd.DataFrame):
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(repr(df.columns.tolist()).encode())
+    h.update(repr(df.dtypes.astype(str).tolist()).encode())
+    return h.hexdigest()
+
+def file_fingerprint(file_path):
+    h = hashlib.sha256()
+    if isinstance(file_path, (str, os.PathLike)):
+        stat = os.stat(file_path)
+        h.update(repr((os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)).encode())
+    else:
+        file_path.seek(0)
+        for block in iter(lambda: file_path.read(1024**2), b""):
+            h.update(block)
+        file_path.seek(0)
+    return h.hexdigest()
+
+def make_key(*parts):
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class ResultCache:
+    # entries are kept pickled so the memory cap counts real bytes;
+    # every entry is also written to disk so a restarted app can reuse it
+
+    def __init__(self, directory=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _remember(self, key, payload):
+        if key in self._entries:
+            self._memory_bytes -= len(self._entries.pop(key))
+        if len(payload) > self.max_memory_bytes:
+            return
+        self._entries[key] = payload
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _load_from_disk(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return payload
+
+    def _write_to_disk(self, key, payload):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._prune_disk()
+
+    def _prune_disk(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            else:
+                payload = self._load_from_disk(key)
+                if payload is None:
+                    return default
+                self._remember(key, payload)
+        try:
+            return pickle.loads(payload)
+        except Exception:
+            self.discard(key)
+            return default
+
+    def put(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, payload)
+            self._write_to_disk(key, payload)
+
+    def discard(self, key):
+        with self._lock:
+            payload = self._entries.pop(key, None)
+            if payload is not None:
+                self._memory_bytes -= len(payload)
+            if self.directory is not None:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        return value
@@ -0,0 +1,189 @@
+import os
+import sys
+
+from factor_analyzer import FactorAnalyzer
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+
+from retention import retention_recommendation
+
+# upload reading is shared with the Conjoint app through ingestion.py at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingestion import COLUMNAR_SUFFIXES, read_chunks, read_file  # noqa: E402
+
+
+def check_nulls(df):
+    # load_file counts nulls while streaming; fall back to a scan otherwise
+    null_counts = df.attrs.get("null_counts")
+    if null_counts is not None:
+        n_nulls = sum(null_counts.values())
+    else:
+        n_nulls = df.isnull().sum().sum()
+
+    if n_nulls != 0:
+        return True
+    else:
+        return False
+
+def subset_data(df, columns):
+    return df.drop(columns, axis=1)
+
+
+def preprocess(df, columns):
+    df = df.dropna()
+    df.attrs.pop("null_counts", None)
+    if columns:
+        df = subset_data(df, columns)
+    return df
+
+def accumulate_moments(chunks, drop_columns=()):
+    # running n, column means and centered cross-product matrix; chunks are
+    # merged pairwise so memory stays O(p^2) whatever the number of rows
+    columns = None
+    n_obs = 0
+    n_dropped = 0
+    mean = None
+    comoment = None
+
+    for chunk in chunks:
+        # listwise deletion, chunk by chunk, over every column before any are dropped,
+        # as preprocess does in memory
+        complete = chunk.notna().all(axis=1).to_numpy()
+        if drop_columns:
+            chunk = chunk.drop(columns=list(drop_columns))
+        if columns is None:
+            columns = chunk.columns.tolist()
+
+        n_dropped += int((~complete).sum())
+        x = chunk.to_numpy(dtype=np.float64)[complete]
+        n_chunk = x.shape[0]
+        if n_chunk == 0:
+            continue
+
+        chunk_mean = x.mean(axis=0)
+        x -= chunk_mean
+        chunk_comoment = x.T @ x
+
+        if n_obs == 0:
+            mean, comoment = chunk_mean, chunk_comoment
+        else:
+            total = n_obs + n_chunk
+            delta = chunk_mean - mean
+            mean = mean + delta * (n_chunk / total)
+            comoment = comoment + chunk_comoment + np.outer(delta, delta) * (n_obs * n_chunk / total)
+        n_obs += n_chunk
+
+    return columns, n_obs, n_dropped, mean, comoment
+
+def stats_from_moments(columns, n_obs, n_dropped, mean, comoment):
+    if n_obs == 0:
+        raise ValueError(f"no complete rows to analyze: all {n_dropped} rows contain null values")
+    cov = comoment / n_obs
+    std = np.sqrt(np.diag(cov))
+    corr = cov / np.outer(std, std)
+
+    return {
+        "columns": columns,
+        "n_obs": n_obs,
+        "n_dropped": n_dropped,
+        "mean": mean,
+        "std": std,
+        "corr": corr,
+        "eigenvalues": np.linalg.eigvalsh(corr)[::-1],
+    }
+
+def correlation_stats(df):
+    # single pass over the data; everything downstream works on the p x p matrix
+    return stats_from_moments(*accumulate_moments([df]))
+
+def streaming_stats(file_path, drop_columns=()):
+    # larger-than-memory mode: the respondent table is never materialized
+    return stats_from_moments(*accumulate_moments(read_chunks(file_path), drop_columns))
+
+def bartlett_sphericity(corr, n_obs):
+    p = corr.shape[0]
+    # slogdet avoids the underflow of det() on wide item batteries
+    _, log_det = np.linalg.slogdet(corr)
+    chi_square_value = -log_det * (n_obs - 1 - (2 * p + 5) / 6)
+    degrees_of_freedom = p * (p - 1) / 2
+    p_value = chi2.sf(chi_square_value, degrees_of_freedom)
+
+    return chi_square_value, p_value
+
+def kmo(corr):
+    try:
+        inv_corr = np.linalg.inv(corr)
+    except np.linalg.LinAlgError:
+        inv_corr = np.linalg.pinv(corr)
+    scale = np.sqrt(np.diag(inv_corr))
+    partial_corr = -inv_corr / np.outer(scale, scale)
+
+    corr_sq = corr**2
+    partial_corr_sq = partial_corr**2
+    np.fill_diagonal(corr_sq, 0)
+    np.fill_diagonal(partial_corr_sq, 0)
+
+    corr_sum = corr_sq.sum(axis=0)
+    partial_corr_sum = partial_corr_sq.sum(axis=0)
+    kmo_all = corr_sum / (corr_sum + partial_corr_sum)
+    kmo_model = corr_sum.sum() / (corr_sum.sum() + partial_corr_sum.sum())
+
+    return kmo_all, kmo_model
+
+def adequacy_results(stats):
+    chi_square_value, p_value = bartlett_sphericity(stats["corr"], stats["n_obs"])
+    kmo_all, kmo_model = kmo(stats["corr"])
+
+    return {
+        "chi_square_value": chi_square_value,
+        "p_value": p_value,
+        "kmo_all": kmo_all,
+        "kmo_model": kmo_model,
+    }
+
+def is_adequate(results):
+    return bool((results["p_value"] < 0.05) & (results["kmo_model"] > 0.6))
+
+def fit_factor_analyzer(stats, n_factors: int,rotation=None):
+    fa = FactorAnalyzer(n_factors=n_factors,rotation=rotation,is_corr_matrix=True)
+    fa.fit(stats["corr"])
+    # fitting on the correlation matrix skips these; transform() needs them to score respondents
+    fa.mean_ = stats["mean"]
+    fa.std_ = stats["std"]
+
+    return fa
+
+def determine_n_factors(eigenvalue, reference=None):
+    if reference is not None and "threshold" in reference:
+        return retention_recommendation(eigenvalue, reference["threshold"])
+    if reference is not None and "lower" in reference:
+        return retention_recommendation(reference["lower"], 1)
+    return eigenvalue[eigenvalue > 1].size
+
+def loadings_frame(fa, columns):
+    cols = [f'Factor{x}' for x in range(1,fa.loadings_.shape[1]+1)]
+    return pd.DataFrame(data=fa.loadings_, index=columns, columns=cols)
+
+def loadings_summary(df, min=0.5):
+    loadings = df.to_numpy()
+    abs_loadings = np.abs(loadings)
+    high = abs_loadings > min
+    n_high = high.sum(axis=1)
+    primary = abs_loadings.argmax(axis=1)
+
+    return pd.DataFrame({
+        "Primary Factor": np.where(n_high > 0, df.columns.to_numpy()[primary], None),
+        "Primary Loading": loadings[np.arange(len(df)), primary],
+        "High Loadings": n_high,
+        "Cross Loading": n_high > 1,
+    }, index=df.index)
+
+def extract_high_loadings_category(df, min: int =0.5):
+    high = np.abs(df.to_numpy()) > min
+    index = df.index.to_numpy()
+
+    return {col: index[high[:, j]].tolist() for j, col in enumerate(df.columns)}
+
+def factor_analysis_summary(fa, columns):
+    return pd.DataFrame(fa.get_factor_variance(), index=['SS Loadings','Proportion Variance','Cumulative Variance'],columns=columns)
@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+BATCH_SIZE = 50
+MAX_WEIGHTED_ELEMENTS = 2**24
+
+_data = None
+
+
+def _correlation_from_scatter(scatter):
+    scale = np.sqrt(np.einsum("bii->bi", scatter))
+    return scatter / (scale[:, :, None] * scale[:, None, :])
+
+def _null_eigenvalues(seed, n_obs, n_vars, n_replicates):
+    # the scatter matrix of n_obs uncorrelated normal rows is Wishart(n_obs - 1, I);
+    # drawing it through the Bartlett decomposition costs O(p^2) instead of O(n p)
+    rng = np.random.default_rng(seed)
+    dof = n_obs - 1 - np.arange(n_vars)
+
+    a = np.tril(rng.standard_normal((n_replicates, n_vars, n_vars)), k=-1)
+    diag = np.sqrt(rng.chisquare(dof, size=(n_replicates, n_vars)))
+    a[:, np.arange(n_vars), np.arange(n_vars)] = diag
+
+    scatter = a @ a.transpose(0, 2, 1)
+    return np.linalg.eigvalsh(_correlation_from_scatter(scatter))[:, ::-1]
+
+def _set_data(x):
+    global _data
+    _data = x
+
+def _bootstrap_eigenvalues(seed, n_replicates):
+    # the resample counts of all replicates are drawn at once and the scatter matrices
+    # are formed as weighted cross-products, a few replicates per matrix product so
+    # the (replicates, n, p) buffer stays under MAX_WEIGHTED_ELEMENTS
+    rng = np.random.default_rng(seed)
+    x = _data
+    n_obs, n_vars = x.shape
+    weights = rng.multinomial(n_obs, np.full(n_obs, 1 / n_obs), size=n_replicates).astype(np.float64)
+
+    scatter = np.empty((n_replicates, n_vars, n_vars))
+    step = max(1, MAX_WEIGHTED_ELEMENTS // (n_obs * n_vars))
+    for start in range(0, n_replicates, step):
+        w = weights[start:start + step]
+        mean = w @ x / n_obs
+        scatter[start:start + step] = ((w[:, :, None] * x).transpose(0, 2, 1) @ x
+                                       - n_obs * mean[:, :, None] * mean[:, None, :])
+    return np.linalg.eigvalsh(_correlation_from_scatter(scatter))[:, ::-1]
+
+def _batches(n_replicates, seed):
+    sizes = [BATCH_SIZE] * (n_replicates // BATCH_SIZE)
+    if n_replicates % BATCH_SIZE:
+        sizes.append(n_replicates % BATCH_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return seeds, sizes
+
+def _run(func, args, n_replicates, seed, n_jobs, initializer=None, initargs=()):
+    seeds, sizes = _batches(n_replicates, seed)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(sizes))
+
+    if n_jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        results = [func(s, *args, size) for s, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs) as pool:
+            results = list(pool.map(func, seeds, *[[a] * len(sizes) for a in args], sizes))
+    return np.concatenate(results)
+
+def parallel_analysis(n_obs: int, n_vars: int, n_replicates: int = 500, percentile: float = 95, n_jobs=None, seed=0):
+    eigenvalues = _run(_null_eigenvalues, (n_obs, n_vars), n_replicates, seed, n_jobs)
+
+    return {
+        "mean": eigenvalues.mean(axis=0),
+        "threshold": np.percentile(eigenvalues, percentile, axis=0),
+        "percentile": percentile,
+    }
+
+def bootstrap_eigenvalues(x, n_replicates: int = 500, ci: float = 95, n_jobs=None, seed=0):
+    # centered once so the weighted cross-products do not lose precision
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x.mean(axis=0)
+    eigenvalues = _run(_bootstrap_eigenvalues, (), n_replicates, seed, n_jobs,
+                       initializer=_set_data, initargs=(x,))
+    tail = (100 - ci) / 2
+
+    return {
+        "lower": np.percentile(eigenvalues, tail, axis=0),
+        "upper": np.percentile(eigenvalues, 100 - tail, axis=0),
+        "ci": ci,
+    }
+
+def retention_recommendation(eigenvalues, threshold):
+    # retain factors while the observed eigenvalue beats the reference one
+    above = np.asarray(eigenvalues) > np.asarray(threshold)
+    return int(above.size if above.all() else np.argmin(above))
@@ -0,0 +1,79 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+
+BLOCK_SIZE = 100_000
+SCORE_METHODS = ("regression", "bartlett")
+
+
+def score_weights(fa, method="regression"):
+    if method not in SCORE_METHODS:
+        raise ValueError(f"method must be one of {SCORE_METHODS}, got {method!r}")
+
+    loadings = fa.loadings_
+    if method == "regression":
+        # Thurstone: W = R^-1 S, with the structure matrix for oblique rotations
+        structure = fa.structure_ if fa.structure_ is not None else loadings
+        return np.linalg.solve(fa.corr_, structure)
+
+    # Bartlett: W = U^-2 L (L' U^-2 L)^-1
+    weighted = loadings / fa.get_uniquenesses()[:, None]
+    return weighted @ np.linalg.inv(loadings.T @ weighted)
+
+def score_blocks(fa, chunks, columns, method="regression", block_size=BLOCK_SIZE):
+    # rows with missing items get NaN scores so output rows line up with input rows
+    weights = score_weights(fa, method)
+    names = [f"Factor{x}" for x in range(1, weights.shape[1] + 1)]
+
+    for chunk in chunks:
+        missing = set(columns) - set(chunk.columns)
+        if missing:
+            raise ValueError(f"Columns used to fit the model are missing: {sorted(missing)}")
+
+        for start in range(0, len(chunk), block_size):
+            block = chunk.iloc[start:start + block_size]
+            x = block[columns].to_numpy(dtype=np.float64)
+            scores = ((x - fa.mean_) / fa.std_) @ weights
+            yield pd.DataFrame(scores.astype(np.float32), index=block.index, columns=names)
+
+def export_factor_scores(fa, chunks, columns, output_path, method="regression", block_size=BLOCK_SIZE):
+    # blocks are written as they are scored; the full score matrix never exists in memory
+    n_rows = 0
+    writer = None
+    try:
+        for i, scores in enumerate(score_blocks(fa, chunks, columns, method, block_size)):
+            if str(output_path).lower().endswith((".parquet", ".pq")):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(scores, preserve_index=True)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+            else:
+                scores.to_csv(output_path, mode="w" if i == 0 else "a", header=(i == 0))
+            n_rows += len(scores)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return n_rows
+
+def dump_model(fa, columns, method="regression"):
+    return pickle.dumps({"model": fa, "columns": list(columns), "method": method})
+
+def save_model(fa, columns, path, method="regression"):
+    with open(path, "wb") as f:
+        f.write(dump_model(fa, columns, method))
+
+def load_model(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def score_wave(model_path, chunks, output_path, block_size=BLOCK_SIZE):
+    # score a new survey wave with a model saved by save_model()
+    saved = load_model(model_path)
+    return export_factor_scores(saved["model"], chunks, saved["columns"], output_path,
+                                saved["method"], block_size)
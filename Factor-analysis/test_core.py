@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import accumulate_moments, correlation_stats, preprocess, read_file, stats_from_moments, streaming_stats
+
+
+BFI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bfi.csv")
+DROP = ["gender", "education", "age"]
+
+
+def test_streaming_matches_in_memory():
+    in_memory = correlation_stats(preprocess(read_file(BFI), DROP))
+    streamed = stats_from_moments(*accumulate_moments(pd.read_csv(BFI, index_col=0, chunksize=300), DROP))
+
+    assert streamed["columns"] == in_memory["columns"]
+    assert streamed["n_obs"] == in_memory["n_obs"]
+    np.testing.assert_allclose(streamed["corr"], in_memory["corr"], atol=1e-10)
+    np.testing.assert_allclose(streamed["mean"], in_memory["mean"], atol=1e-10)
+
+def test_streaming_file_counts_rows_dropped_for_any_column():
+    stats = streaming_stats(BFI, DROP)
+    df = pd.read_csv(BFI, index_col=0)
+
+    assert stats["n_obs"] == len(df.dropna())
+    assert stats["n_obs"] + stats["n_dropped"] == len(df)
+
+def test_all_rows_incomplete_raises():
+    df = pd.DataFrame({"a": [1.0, np.nan], "b": [np.nan, 2.0]})
+    with pytest.raises(ValueError, match="no complete rows"):
+        correlation_stats(df)
@@ -1,17 +1,34 @@
-from factor_analyzer import FactorAnalyzer
-from factor_analyzer.factor_analyzer import calculate_bartlett_sphericity
-from factor_analyzer.factor_analyzer import calculate_kmo
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+from cache import ResultCache, dataset_fingerprint, file_fingerprint, make_key
+# the compute functions live in core so they can run without a browser (see batch.py);
+# they are imported here for app.py
+from core import (
+    read_chunks,
+    read_file,
+    check_nulls,
+    preprocess,
+    correlation_stats,
+    streaming_stats,
+    adequacy_results,
+    is_adequate,
+    fit_factor_analyzer,
+    determine_n_factors,
+    loadings_frame,
+    loadings_summary,
+    extract_high_loadings_category,
+    factor_analysis_summary,
+)
+from scoring import dump_model, score_blocks
 
 
 @st.cache_data
 def load_file(file_path):
     try:
-        df = pd.read_csv(file_path, index_col=0)
-        return df
+        return read_file(file_path)
     except Exception as e:
         st.session_state["file"] = False
         st.error(f"Error loading file: {e}")
@@ -21,12 +38,16 @@ def sidebar():
 
     with st.sidebar:
         st.title("Factor Analysis")
-        uploaded_file = st.file_uploader(label="",type='csv')
+        uploaded_file = st.file_uploader(label="",type=['csv','parquet','arrow','feather'])
 
         if uploaded_file is not None:
             st.session_state["file"] = True
             st.session_state["file_path"] = uploaded_file
 
+        st.session_state["streaming"] = st.checkbox(
+            "Large file mode",
+            help="Stream the file once to accumulate means and covariances instead of loading every row into memory")
+
         st.divider()
         st.write("Test with a sample data")
         with st.popover("Sample Data"):
@@ -63,18 +84,6 @@ def sidebar():
                 st.session_state["file"] = True
                 st.session_state["file_path"] = "./data/bfi.csv"
 
-def check_nulls(df):
-    n_nulls = df.isnull().sum().sum()
-
-    if n_nulls != 0:
-        return True
-    else:
-        return False
-
-def subset_data(df, columns):
-    return df.drop(columns, axis=1)
-
-
 def preprocessing(df: pd.DataFrame, columns: list):
 
     st.markdown("")
@@ -88,19 +97,19 @@ def preprocessing(df: pd.DataFrame, columns: list):
                     """,
                     unsafe_allow_html=True
                     )
-        df = df.dropna()
 
     if columns==[]:
         st.markdown("<div class=description>All columns in the dataset are used in analysis</div>", unsafe_allow_html=True)
 
     if columns != []:
-        df = subset_data(df, columns)
         st.markdown(f"""
                         <div class=description>
                             Feature(s), <code>{columns}</code>, is/are removed from the dataset....
                         </div>
                     """,
                     unsafe_allow_html=True)
+
+    df = preprocess(df, columns)
     st.markdown("###")
 
     st.markdown("**Check data table**")
@@ -112,10 +121,65 @@ def preprocessing(df: pd.DataFrame, columns: list):
 
     return df
 
-def adequacy_test(df):
+def streaming_preprocessing(stats, columns: list):
+
+    st.markdown("")
+    st.subheader("Preprocessing data")
+
+    st.markdown("""
+                <div class=description>
+                    <p>The file is streamed in chunks; rows with null values are removed chunk by chunk....</p>
+                </div>
+                """,
+                unsafe_allow_html=True
+                )
+
+    if columns==[]:
+        st.markdown("<div class=description>All columns in the dataset are used in analysis</div>", unsafe_allow_html=True)
+    else:
+        st.markdown(f"""
+                        <div class=description>
+                            Feature(s), <code>{columns}</code>, is/are removed from the dataset....
+                        </div>
+                    """,
+                    unsafe_allow_html=True)
+    st.markdown("###")
+
+    st.markdown(f"""
+                    <div class=description>
+                        Rows used : <code>{stats["n_obs"]}</code>, rows removed : <code>{stats["n_dropped"]}</code><br>
+                        Columns used : <code>{len(stats["columns"])}</code>
+                    </div>
+                """,
+                unsafe_allow_html=True)
+
+@st.cache_resource
+def result_cache():
+    return ResultCache()
+
+@st.cache_data
+def data_fingerprint(df):
+    return dataset_fingerprint(df)
+
+def cached(func, fingerprint, options, params, *args):
+    # results are keyed on what produced them: the preprocessed data, the
+    # dropped columns and the parameters (n_factors, rotation) of the step
+    key = make_key(func.__name__, fingerprint, sorted(options), params)
+    return result_cache().get_or_compute(key, func, *args)
+
+@st.cache_data
+def load_preview(file_path, n_rows=1000):
+    try:
+        return next(read_chunks(file_path, chunksize=n_rows))
+    except Exception as e:
+        st.session_state["file"] = False
+        st.error(f"Error loading file: {e}")
+        return None
+
+def adequacy_test(results):
 
     st.subheader("A. Bartlett's test for Sphericity")
-    chi_square_value,p_value=calculate_bartlett_sphericity(df.values)
+    chi_square_value,p_value=results["chi_square_value"], results["p_value"]
     st.markdown(f"""
                     <div class=description>
                         Bartlett's test result: <br>
@@ -127,7 +191,7 @@ def adequacy_test(df):
                 """,
                 unsafe_allow_html=True)
     st.subheader("B. Kaiser-Myer-Olkin test")
-    kmo_all,kmo_model=calculate_kmo(df)
+    kmo_model=results["kmo_model"]
     st.markdown(f"""
                     <div class=description>
                         Kaiser-Myer-Olkin test result: <code>{kmo_model:.4f}</code>
@@ -137,7 +201,7 @@ def adequacy_test(df):
 
     st.write("")
 
-    if (p_value < 0.05) & (kmo_model > 0.6):
+    if is_adequate(results):
         st.session_state["adequacy_test"] = True
         st.success("The data passes the adequacy tests for factor anlysis", icon="✅")
 
@@ -145,14 +209,9 @@ def adequacy_test(df):
         st.session_state["adequacy_test"]=False
         st.warning("Factor Analysis may not be appropriate for this dataset!")
 
-def fit_factor_analyzer(df, n_factors: int,rotation=None):
-    fa = FactorAnalyzer(n_factors=n_factors,rotation=rotation)
-    fa.fit(df)
-
-    return fa
-
-def scree_plot(df, eigenvalue):
-    fig = px.line(x=range(1,df.shape[1]+1),y=eigenvalue, markers=True)
+def scree_plot(eigenvalue, reference=None):
+    factors = list(range(1,len(eigenvalue)+1))
+    fig = px.line(x=factors,y=eigenvalue, markers=True)
     fig.update_layout(
         title  ={
             "text":"Scree Plot",
@@ -166,23 +225,19 @@ def scree_plot(df, eigenvalue):
     )
     fig.add_hline(y=1, line_dash="dash")
 
-    return st.plotly_chart(fig)
-
-def determine_n_factors(eigenvalue):
-    return eigenvalue[eigenvalue > 1].size
+    if reference is not None and "threshold" in reference:
+        fig.add_scatter(x=factors, y=reference["threshold"], mode="lines", line_dash="dot",
+                        name=f"Parallel analysis ({reference['percentile']:g}th pct)")
+    if reference is not None and "lower" in reference:
+        fig.add_scatter(x=factors, y=reference["upper"], mode="lines", line_width=0, showlegend=False)
+        fig.add_scatter(x=factors, y=reference["lower"], mode="lines", line_width=0, fill="tonexty",
+                        name=f"Bootstrap {reference['ci']:g}% CI")
 
-def highlight_cells(val,min=0.5):
-
-    color = "grey" if abs(val) > min else ''
-    return "background-color: {}".format(color)
-
-def extract_high_loadings_category(df, min: int =0.5):
-    data = {}
-
-    for col in df.columns:
-        data[col] = df[abs(df.loc[:,col]) > min][col].index.tolist()
+    return st.plotly_chart(fig)
 
-    return data
+def highlight_cells(df, min=0.5):
+    # applied once over the whole frame with Styler.apply(axis=None)
+    return np.where(np.abs(df.to_numpy()) > min, "background-color: grey", "")
 
 def high_loading_factors(df, min:int =0.5):
 
@@ -190,15 +245,33 @@ def high_loading_factors(df, min:int =0.5):
 
     st.subheader("Features associated with Factor(s)")
 
-    for key in data.keys():
-        if data[key] != []:
-            st.markdown(f"- {key} has High Loading Factor for {data[key]}",unsafe_allow_html=True)
-        else:
-            st.markdown(f"- {key} has no High Loading Factor",unsafe_allow_html=True)
-
-
-def factor_analysis_summary(fa, columns):
-    return pd.DataFrame(fa.get_factor_variance(), index=['SS Loadings','Proportion Variance','Cumulative Variance'],columns=columns)
+    lines = [f"- {key} has High Loading Factor for {items}" if items else f"- {key} has no High Loading Factor"
+             for key, items in data.items()]
+    st.markdown("\n".join(lines),unsafe_allow_html=True)
+
+    summary = loadings_summary(df, min)
+    cross_loading = summary.index[summary["Cross Loading"]].tolist()
+    if cross_loading:
+        st.markdown(f"- Cross loading (high loading on more than one factor) : <code>{cross_loading}</code>",unsafe_allow_html=True)
+
+    with st.expander("View primary factor per feature"):
+        st.dataframe(summary)
+
+
+def export_factor_model(fa, stats, df=None):
+
+    st.subheader("Export")
+    cols = st.columns(2)
+    with cols[0]:
+        st.download_button("Download fitted model", data=dump_model(fa, stats["columns"]),
+                           file_name="factor_model.pkl",
+                           help="Score new survey waves with scoring.score_wave() outside the app")
+    with cols[1]:
+        # scores are only offered when the data is in memory; in large file mode use the saved model
+        if df is not None and st.checkbox("Compute factor scores"):
+            scores = pd.concat(score_blocks(fa, [df], stats["columns"]))
+            st.download_button("Download factor scores (CSV)", data=scores.to_csv().encode(),
+                               file_name="factor_scores.csv")
 
 def factor_loading_plot(df, X, Y):
     fig = px.scatter(data_frame=df, x=X, y=Y,text=df.index)
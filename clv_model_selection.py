@@ -0,0 +1,314 @@
+"""Choose between the CLV models of CLV_model_selection.txt on a calibration /
+holdout split of the transaction log.
+
+    python clv_model_selection.py data/online_retail.csv --calibration-end 2011-09-08 \
+        --output data/clv_model_selection.csv --nuts --posterior data/clv_posterior.npz
+
+Every candidate (BG/NBD, Pareto/NBD, BG/BB) is fitted on the calibration period
+in its own process. The screening fit is either "map", which maximises the
+closed-form likelihood with scipy, or "advi", PyMC mean-field ADVI. Both use
+flat (HalfFlat) priors, so "map" is the maximum-likelihood point; it is not the
+point pymc_marketing's find_MAP returns for the default BetaGeoModel, whose priors
+are not flat. Candidates are ranked by how well they predict each
+customer's purchase periods in the holdout. Only the winner is then sampled with
+NUTS, with the chains running in parallel. --posterior writes BG/NBD and
+Gamma-Gamma draws in the npz format of clv_scoring.load_posterior, the only
+models clv_scoring and clv_refresh score; when another model wins, BG/NBD is
+sampled for the file as well.
+
+BG/BB is a discrete-time model: every day after a customer's first purchase is
+one purchase opportunity, matching the daily periods of clv_summary.
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.special import gammaln, hyp2f1, logsumexp
+
+from clv_refresh import STATE_COLUMNS, RFMStore, customer_state, to_days
+from clv_scoring import GAMMA_GAMMA_PARAMS, expected_num_purchases, thin
+from rfm_builder import clean_transactions, read_chunks
+
+
+N_PREDICTIVE_DRAWS = 200
+ADVI_ITERATIONS = 30_000
+MAX_FREQUENCY_BIN = 7
+
+NUMPY_MATH = SimpleNamespace(log=np.log, gammaln=gammaln, hyp2f1=hyp2f1, where=np.where,
+                             logaddexp=np.logaddexp, logsumexp=logsumexp, concatenate=np.concatenate)
+
+
+def _pytensor_math():
+    import pymc as pm
+    import pytensor.tensor as pt
+
+    return SimpleNamespace(log=pt.log, gammaln=pt.gammaln, hyp2f1=pt.hyp2f1, where=pt.switch,
+                           logaddexp=pm.math.logaddexp, logsumexp=pm.math.logsumexp, concatenate=pt.concatenate)
+
+def _betaln(m, a, b):
+    return m.gammaln(a) + m.gammaln(b) - m.gammaln(a + b)
+
+def bgnbd_loglike(params, x, t_x, T, m=NUMPY_MATH):
+    # Fader, Hardie & Lee (2005) in the rearranged form of their #NUM! note, as pymc_marketing's BetaGeoModel
+    a, b, alpha, r = params
+    d1 = m.gammaln(r + x) - m.gammaln(r) + m.gammaln(a + b) + m.gammaln(b + x) - m.gammaln(b) - m.gammaln(a + b + x)
+    d2 = r * m.log(alpha) - (r + x) * m.log(alpha + t_x)
+    log_c3 = (r + x) * (m.log(alpha + t_x) - m.log(alpha + T))
+    log_c4 = m.log(a) - m.log(b + np.maximum(x, 1) - 1)
+    return d1 + d2 + m.where(x > 0, m.logaddexp(log_c3, log_c4), log_c3)
+
+def pareto_nbd_loglike(params, x, t_x, T, m=NUMPY_MATH):
+    # Schmittlein et al. (1987) as rearranged in pymc_marketing's ParetoNBD distribution
+    r, alpha, s, beta = params
+    rsx, rx = r + s + x, r + x
+    alpha_larger = alpha >= beta
+    larger = m.where(alpha_larger, alpha, beta)
+    difference = m.where(alpha_larger, alpha - beta, beta - alpha)
+
+    refactored = rsx * m.log(larger + t_x)
+    hyp2f1_t1 = m.log(m.hyp2f1(rsx, m.where(alpha_larger, s + 1, rx), rsx + 1, difference / (larger + t_x)))
+    hyp2f1_t2 = (m.log(m.hyp2f1(rsx, m.where(alpha_larger, s, rx + 1), rsx + 1, difference / (larger + T)))
+                 - rsx * m.log(larger + T) + refactored)
+
+    a1 = m.gammaln(rx) - m.gammaln(r) + r * m.log(alpha) + s * m.log(beta) - refactored
+    return a1 + m.logaddexp(m.log(s) - m.log(rsx) + hyp2f1_t1, m.log(rx) - m.log(rsx) + hyp2f1_t2)
+
+def bgbb_loglike(params, x, t_x, n, m=NUMPY_MATH):
+    # Fader, Hardie & Shang (2010): alive for all n opportunities, or dropped out
+    # right after opportunity t_x + j for some j < n - t_x
+    alpha, beta, gamma, delta = params
+    purchase, dropout = _betaln(m, alpha, beta), _betaln(m, gamma, delta)
+    j = np.arange(int(np.max(n - t_x, initial=0)))
+    after_last = j[None, :] < (n - t_x)[:, None]
+
+    alive = _betaln(m, alpha + x, beta + n - x) - purchase + _betaln(m, gamma, delta + n) - dropout
+    dropped = (_betaln(m, alpha + x[:, None], beta + (t_x - x)[:, None] + j) - purchase
+               + _betaln(m, gamma + 1, delta + t_x[:, None] + j) - dropout)
+    terms = m.concatenate([alive[:, None], m.where(after_last, dropped, -np.inf)], axis=1)
+    return m.logsumexp(terms, axis=1, keepdims=False)
+
+def bgnbd_expected_purchases(params, t, x, t_x, T):
+    posterior = {param: np.array([value]) for param, value in zip(MODELS["bgnbd"]["params"], params)}
+    return expected_num_purchases(posterior, t, x, t_x, T)[0]
+
+def pareto_nbd_expected_purchases(params, t, x, t_x, T):
+    r, alpha, s, beta = params
+    alive = (gammaln(r + x) - gammaln(r) + r * np.log(alpha) + s * np.log(beta)
+             - (r + x) * np.log(alpha + T) - s * np.log(beta + T))
+    scale = np.log(r + x) + np.log(beta + T) - np.log(alpha + T)
+    horizon = (1 - ((beta + T) / (beta + T + t)) ** (s - 1)) / (s - 1)
+    return np.exp(alive + scale - pareto_nbd_loglike(params, x, t_x, T)) * horizon
+
+def bgbb_expected_purchases(params, t, x, t_x, n):
+    alpha, beta, gamma, delta = params
+    purchase = _betaln(NUMPY_MATH, alpha + x + 1, beta + n - x) - _betaln(NUMPY_MATH, alpha, beta)
+    survival = delta / (gamma - 1) * np.exp(gammaln(gamma + delta) - gammaln(1 + delta))
+    remaining = (np.exp(gammaln(1 + delta + n) - gammaln(gamma + delta + n))
+                 - np.exp(gammaln(1 + delta + n + t) - gammaln(gamma + delta + n + t)))
+    return np.exp(purchase - bgbb_loglike(params, x, t_x, n)) * survival * remaining
+
+def gamma_gamma_loglike(params, x, mean_spend, m=NUMPY_MATH):
+    # Fader, Hardie & Lee (2005) spend model of repeat customers, as pymc_marketing's GammaGammaModel
+    p, q, v = params
+    px = p * x
+    return (m.gammaln(px + q) - m.gammaln(px) - m.gammaln(q) + q * m.log(v)
+            + (px - 1) * m.log(mean_spend) + px * m.log(x) - (px + q) * m.log(x * mean_spend + v))
+
+MODELS = {
+    "bgnbd": {"label": "BG/NBD", "params": ("a", "b", "alpha", "r"),
+              "loglike": bgnbd_loglike, "expected": bgnbd_expected_purchases},
+    "pareto_nbd": {"label": "Pareto/NBD", "params": ("r", "alpha", "s", "beta"),
+                   "loglike": pareto_nbd_loglike, "expected": pareto_nbd_expected_purchases},
+    "bgbb": {"label": "BG/BB", "params": ("alpha", "beta", "gamma", "delta"),
+             "loglike": bgbb_loglike, "expected": bgbb_expected_purchases},
+}
+
+def rfm_patterns(summary):
+    # unique (frequency, recency, T) rows with their counts; the likelihoods only see these
+    rows = summary[["frequency", "recency", "T"]].to_numpy(dtype=np.float64)
+    patterns, inverse, counts = np.unique(rows, axis=0, return_inverse=True, return_counts=True)
+    return {"x": patterns[:, 0], "t_x": patterns[:, 1], "T": patterns[:, 2],
+            "weights": counts.astype(np.float64), "inverse": inverse.ravel()}
+
+def total_loglike(name, params, patterns):
+    loglike = MODELS[name]["loglike"](params, patterns["x"], patterns["t_x"], patterns["T"])
+    return float(np.sum(patterns["weights"] * loglike))
+
+def fit_map(name, patterns):
+    # flat priors: the MAP is the maximum-likelihood point, searched over log parameters
+    def objective(log_params):
+        value = -total_loglike(name, np.exp(log_params), patterns)
+        return value if np.isfinite(value) else 1e300
+
+    result = minimize(objective, np.zeros(len(MODELS[name]["params"])), method="L-BFGS-B")
+    return {param: np.array([value]) for param, value in zip(MODELS[name]["params"], np.exp(result.x))}
+
+def pymc_model(name, patterns):
+    import pymc as pm
+
+    spec = MODELS[name]
+    with pm.Model() as model:
+        params = [pm.HalfFlat(param) for param in spec["params"]]
+        loglike = spec["loglike"](params, patterns["x"], patterns["t_x"], patterns["T"], _pytensor_math())
+        pm.Potential("likelihood", (patterns["weights"] * loglike).sum())
+    return model
+
+def _posterior_draws(name, idata):
+    # chains are flattened into one draw axis, as clv_scoring.save_posterior
+    return {param: idata.posterior[param].values.ravel() for param in MODELS[name]["params"]}
+
+def fit_advi(name, patterns, n_iter=ADVI_ITERATIONS, draws=N_PREDICTIVE_DRAWS, seed=0):
+    import pymc as pm
+
+    with pymc_model(name, patterns):
+        approx = pm.fit(n=n_iter, method="advi", random_seed=seed, progressbar=False)
+    return _posterior_draws(name, approx.sample(draws, random_seed=seed))
+
+def fit_nuts(name, patterns, draws=1000, tune=1000, chains=4, cores=None, seed=0):
+    import pymc as pm
+
+    with pymc_model(name, patterns):
+        idata = pm.sample(draws=draws, tune=tune, chains=chains, cores=cores or chains,
+                          random_seed=seed, progressbar=False)
+    return _posterior_draws(name, idata)
+
+def fit_gamma_gamma_nuts(summary, draws=1000, tune=1000, chains=4, cores=None, seed=0):
+    # the spend model clv_scoring pairs with BG/NBD, on customers with repeat purchases
+    import pymc as pm
+
+    repeat = summary[(summary["frequency"] > 0) & (summary["monetary_value"] > 0)]
+    x = repeat["frequency"].to_numpy(dtype=np.float64)
+    mean_spend = repeat["monetary_value"].to_numpy(dtype=np.float64)
+    with pm.Model():
+        params = [pm.HalfFlat(param) for param in GAMMA_GAMMA_PARAMS]
+        pm.Potential("likelihood", gamma_gamma_loglike(params, x, mean_spend, _pytensor_math()).sum())
+        idata = pm.sample(draws=draws, tune=tune, chains=chains, cores=cores or chains,
+                          random_seed=seed, progressbar=False)
+    return {param: idata.posterior[param].values.ravel() for param in GAMMA_GAMMA_PARAMS}
+
+def _screen(name, patterns, mode, seed):
+    start = time.perf_counter()
+    draws = fit_map(name, patterns) if mode == "map" else fit_advi(name, patterns, seed=seed)
+    return name, draws, time.perf_counter() - start
+
+def screen_models(patterns, models=tuple(MODELS), mode="map", n_jobs=None, seed=0):
+    # one process per candidate; returns {name: (draws, seconds)}
+    n_jobs = min(n_jobs or len(models), len(models))
+    args = ([patterns] * len(models), [mode] * len(models), [seed] * len(models))
+    if n_jobs <= 1:
+        results = map(_screen, models, *args)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_screen, models, *args))
+    return {name: (draws, seconds) for name, draws, seconds in results}
+
+def calibration_holdout(transactions, calibration_end, observation_end=None):
+    # transactions: customer_id, day, value; clv_summary of the calibration period, the
+    # purchase periods of those customers after it, and the holdout length in days
+    calibration_end = int(to_days([calibration_end])[0])
+    end = int(transactions["day"].max()) if observation_end is None else int(to_days([observation_end])[0])
+    if end <= calibration_end:
+        raise ValueError("the calibration period must end before the observation period")
+
+    state = customer_state(transactions[transactions["day"] <= calibration_end]).astype(STATE_COLUMNS)
+    calibration = RFMStore(state, calibration_end).summary()
+    later = transactions[(transactions["day"] > calibration_end) & (transactions["day"] <= end)]
+    holdout = later.groupby("customer_id")["day"].nunique().reindex(calibration.index, fill_value=0)
+    return calibration, holdout.to_numpy(dtype=np.float64), end - calibration_end
+
+def holdout_predictions(name, draws, patterns, duration, n_draws=N_PREDICTIVE_DRAWS):
+    # posterior mean of the expected purchases in the holdout, per customer
+    spec = MODELS[name]
+    draws = thin(draws, n_draws)
+    n = len(draws[spec["params"][0]])
+    args = (duration, patterns["x"], patterns["t_x"], patterns["T"])
+    expected = np.mean([spec["expected"]([draws[p][i] for p in spec["params"]], *args) for i in range(n)], axis=0)
+    return expected[patterns["inverse"]]
+
+def compare_models(fits, patterns, holdout, duration):
+    # holdout fit of every candidate, best (lowest RMSE) first
+    rows, predictions = [], {}
+    for name, (draws, seconds) in fits.items():
+        point = [np.mean(draws[param]) for param in MODELS[name]["params"]]
+        predictions[name] = prediction = holdout_predictions(name, draws, patterns, duration)
+        error = prediction - holdout
+        rows.append({
+            "model": name,
+            "label": MODELS[name]["label"],
+            "log_likelihood": total_loglike(name, point, patterns),
+            "holdout_rmse": float(np.sqrt(np.mean(error ** 2))),
+            "holdout_mae": float(np.mean(np.abs(error))),
+            "predicted_purchases": float(prediction.sum()),
+            "actual_purchases": float(holdout.sum()),
+            "fit_seconds": seconds,
+            **{f"param_{param}": value for param, value in zip(MODELS[name]["params"], point)},
+        })
+    comparison = pd.DataFrame(rows).set_index("model").sort_values("holdout_rmse")
+    return comparison, predictions
+
+def calibration_table(calibration, holdout, predictions, max_frequency=MAX_FREQUENCY_BIN):
+    # mean holdout purchases by calibration frequency, the usual calibration/holdout plot data
+    frequency = np.minimum(calibration["frequency"].to_numpy(), max_frequency).astype(int)
+    table = pd.DataFrame({"frequency": frequency, "actual": holdout,
+                          **{MODELS[name]["label"]: values for name, values in predictions.items()}})
+    table = table.groupby("frequency").mean()
+    table.insert(0, "customers", np.bincount(frequency)[table.index])
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CLV model selection on a calibration/holdout split")
+    parser.add_argument("transactions", nargs="+", help="CSV or parquet transaction files")
+    parser.add_argument("--calibration-end", required=True, help="last day of the calibration period")
+    parser.add_argument("--observation-end", default=None, help="last day of the holdout (default: last transaction)")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--mode", choices=["map", "advi"], default="map", help="screening fit")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--nuts", action="store_true", help="sample the winner with NUTS on the full period")
+    parser.add_argument("--draws", type=int, default=1000)
+    parser.add_argument("--tune", type=int, default=1000)
+    parser.add_argument("--chains", type=int, default=4)
+    parser.add_argument("--posterior", default=None, help="save the winner's NUTS draws here (npz)")
+    parser.add_argument("--output", default=None, help="write the model comparison here (csv)")
+    parser.add_argument("--date-format", default=None, help="strftime format of InvoiceDate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    raw = pd.concat([chunk for path in args.transactions for chunk in read_chunks(path)], ignore_index=True)
+    transactions = clean_transactions(raw, args.date_format)
+    calibration, holdout, duration = calibration_holdout(transactions, args.calibration_end, args.observation_end)
+    patterns = rfm_patterns(calibration)
+    print(f"{len(calibration)} customers, {len(patterns['x'])} distinct RFM patterns, {duration}-day holdout")
+
+    fits = screen_models(patterns, args.models, args.mode, args.workers, args.seed)
+    comparison, predictions = compare_models(fits, patterns, holdout, duration)
+    print(comparison[["label", "log_likelihood", "holdout_rmse", "holdout_mae",
+                      "predicted_purchases", "actual_purchases", "fit_seconds"]].to_string())
+    print(calibration_table(calibration, holdout, predictions).to_string())
+    if args.output:
+        comparison.to_csv(args.output)
+
+    winner = comparison.index[0]
+    print(f"selected {MODELS[winner]['label']}")
+    if args.nuts:
+        full = RFMStore(customer_state(transactions).astype(STATE_COLUMNS), int(transactions["day"].max())).summary()
+        full_patterns = rfm_patterns(full)
+        sampling = dict(draws=args.draws, tune=args.tune, chains=args.chains, seed=args.seed)
+        draws = fit_nuts(winner, full_patterns, **sampling)
+        print(pd.DataFrame(draws).describe().T[["mean", "std"]].to_string())
+        if args.posterior:
+            # clv_scoring and clv_refresh score BG/NBD with a Gamma-Gamma spend model only
+            if winner != "bgnbd":
+                print(f"{MODELS[winner]['label']} cannot be scored by clv_scoring; sampling BG/NBD for {args.posterior}")
+                draws = fit_nuts("bgnbd", full_patterns, **sampling)
+            np.savez(args.posterior, **draws, **fit_gamma_gamma_nuts(full, **sampling))
+    print(f"done in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
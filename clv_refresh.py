@@ -0,0 +1,219 @@
+"""Fold new invoices into a per-customer RFM state store and re-score only the
+customers they touch, using the posterior draws of the last full fit.
+
+    # once, after the full fit in CustomerLifetimeValue.ipynb
+    #   save_posterior("data/clv_posterior.npz", bgm, gg)
+    python clv_refresh.py data/online_retail.csv --init --store data/rfm_state.parquet \
+        --posterior data/clv_posterior.npz
+    # (for logs that do not fit in memory, build the store with rfm_builder.py --store)
+
+    # daily
+    python clv_refresh.py new_invoices.csv --store data/rfm_state.parquet \
+        --posterior data/clv_posterior.npz --output data/clv_estimates_output.csv
+
+The store keeps, per customer, the first and last purchase day, the number of
+purchase days and the spend totals needed to rebuild the clv_summary columns
+(frequency, recency, T, monetary_value in days) without the transaction log.
+Scores of customers without new invoices keep the date they were computed at;
+--max-age re-scores those older than the given number of days as well.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from clv_scoring import BLOCK_SIZE, load_posterior, score_summary
+
+
+STATE_COLUMNS = {
+    "first_day": np.int32,
+    "last_day": np.int32,
+    "n_periods": np.int32,
+    "total": np.float64,
+    "first_total": np.float64,
+}
+SCORE_COLUMNS = ["expected_purchases", "p_alive", "clv_estimate", "clv_estimate_hdi_3%", "clv_estimate_hdi_97%"]
+NOT_SCORED = -1
+CANCEL_KEYS = ["CustomerID", "StockCode", "Quantity", "UnitPrice"]
+CSV_DTYPES = {"InvoiceNo": str, "StockCode": str, "Quantity": np.int32, "UnitPrice": np.float64}
+
+
+def to_days(dates, format=None):
+    # calendar day number since 1970-01-01, the daily period clv_summary aggregates on
+    return pd.to_datetime(dates, format=format).to_numpy("datetime64[D]").astype(np.int64).astype(np.int32)
+
+def clean_transactions(transactions, date_format=None):
+    # customer_id, day, value rows left after the notebook's cancellation join
+    transactions = transactions[transactions["CustomerID"].notna()]
+    cancelled = transactions["InvoiceNo"].astype(str).str.startswith("C").to_numpy()
+
+    # a cancellation line carries the negated quantity of the order line it voids
+    returns = transactions[cancelled]
+    returned = pd.MultiIndex.from_arrays([returns["CustomerID"], returns["StockCode"],
+                                         -returns["Quantity"], returns["UnitPrice"]])
+    voided = pd.MultiIndex.from_arrays([transactions[col] for col in CANCEL_KEYS]).isin(returned)
+
+    kept = transactions[~(cancelled | voided)]
+    customers = kept["CustomerID"].to_numpy()
+    if customers.dtype.kind == "f" and np.all(customers % 1 == 0):
+        # read_csv parses CustomerID as float when some ids are missing
+        customers = customers.astype(np.int64)
+    return pd.DataFrame({
+        "customer_id": customers,
+        "day": to_days(kept["InvoiceDate"], date_format),
+        "value": kept["Quantity"].to_numpy(dtype=np.float64) * kept["UnitPrice"].to_numpy(),
+    })
+
+def customer_state(transactions):
+    # STATE_COLUMNS per customer from customer_id, day, value rows, purchases summed per day
+    daily = transactions.groupby(["customer_id", "day"], sort=True)["value"].sum().reset_index()
+    return daily.groupby("customer_id", sort=False).agg(
+        first_day=("day", "first"), last_day=("day", "last"), n_periods=("day", "size"),
+        total=("value", "sum"), first_total=("value", "first"))
+
+class RFMStore:
+    def __init__(self, state=None, observation_end=None):
+        if state is None:
+            state = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in STATE_COLUMNS.items()})
+            state.index = pd.Index([], dtype=np.int64, name="customer_id")
+        self.state = state
+        self.observation_end = observation_end
+
+    @classmethod
+    def load(cls, path):
+        state = pd.read_parquet(path)
+        return cls(state, state.attrs.get("observation_end"))
+
+    def save(self, path):
+        self.state.attrs["observation_end"] = self.observation_end
+        self.state.to_parquet(path)
+
+    def update(self, transactions):
+        # transactions: customer_id, day, value (see clean_transactions); returns touched customer ids
+        if transactions.empty:
+            return np.array([], dtype=np.int64)
+        if self.observation_end is not None and transactions["day"].min() < self.observation_end:
+            raise ValueError("transactions dated before the store's observation end cannot be folded in; rebuild the store")
+
+        batch = customer_state(transactions)
+
+        position = self.state.index.get_indexer(batch.index)
+        known = position >= 0
+        rows, new = position[known], batch[known]
+        first_day, last_day = self.state["first_day"].to_numpy(), self.state["last_day"].to_numpy()
+        # a purchase on the customer's last stored day extends that period instead of adding one
+        same_day = new["first_day"].to_numpy() == last_day[rows]
+        single_period = (first_day[rows] == last_day[rows]) & same_day
+
+        updates = {
+            "n_periods": self.state["n_periods"].to_numpy()[rows] + new["n_periods"].to_numpy() - same_day,
+            "total": self.state["total"].to_numpy()[rows] + new["total"].to_numpy(),
+            "first_total": self.state["first_total"].to_numpy()[rows] + np.where(single_period, new["first_total"].to_numpy(), 0.0),
+            "last_day": new["last_day"].to_numpy(),
+        }
+        for col, values in updates.items():
+            column = self.state[col].to_numpy(copy=True)
+            column[rows] = values
+            self.state[col] = column
+
+        added = batch[~known].astype(STATE_COLUMNS)
+        if len(added):
+            for col in SCORE_COLUMNS:
+                if col in self.state:
+                    added[col] = np.nan
+            if "scored_day" in self.state:
+                added["scored_day"] = NOT_SCORED
+            self.state = pd.concat([self.state, added]) if len(self.state) else added
+            self.state.index.name = "customer_id"
+
+        self.observation_end = max(int(batch["last_day"].max()), self.observation_end or 0)
+        return batch.index.to_numpy()
+
+    def summary(self, customers=None):
+        # clv_summary-compatible frame: frequency, recency, T in days and repeat-purchase monetary value
+        state = self.state if customers is None else self.state.loc[customers]
+        frequency = state["n_periods"].to_numpy() - 1
+        repeat_total = state["total"].to_numpy() - state["first_total"].to_numpy()
+        return pd.DataFrame({
+            "customer_id": state.index,
+            "frequency": frequency.astype(float),
+            "recency": (state["last_day"] - state["first_day"]).to_numpy(dtype=float),
+            "T": (self.observation_end - state["first_day"].to_numpy()).astype(float),
+            "monetary_value": np.divide(repeat_total, frequency, out=np.zeros(len(state)), where=frequency > 0),
+        }, index=state.index)
+
+    def stale(self, max_age):
+        # customers whose stored score is older than max_age days (or missing)
+        if "scored_day" not in self.state:
+            return self.state.index.to_numpy()
+        scored = self.state["scored_day"].to_numpy()
+        return self.state.index[(scored == NOT_SCORED) | (self.observation_end - scored > max_age)].to_numpy()
+
+def score(summary, posterior, t=365, time=120, discount_rate=0.01, freq="D", block_size=BLOCK_SIZE, n_jobs=None):
+    scores = score_summary(summary, posterior, t=t, time=time, discount_rate=discount_rate, freq=freq,
+                           block_size=block_size, n_jobs=n_jobs)
+    return scores[SCORE_COLUMNS]
+
+def refresh(store, posterior, customers, **kwargs):
+    if len(customers) == 0:
+        return 0
+    scores = score(store.summary(customers), posterior, **kwargs)
+    for col in SCORE_COLUMNS:
+        if col not in store.state:
+            store.state[col] = np.nan
+    if "scored_day" not in store.state:
+        store.state["scored_day"] = np.int32(NOT_SCORED)
+    store.state.loc[scores.index, SCORE_COLUMNS] = scores[SCORE_COLUMNS]
+    store.state.loc[scores.index, "scored_day"] = store.observation_end
+    return len(scores)
+
+def export_estimates(store, output_path):
+    # same columns as the notebook's data/clv_estimates_output.csv
+    if "scored_day" not in store.state:
+        raise ValueError("the store has never been scored; run a refresh with --posterior before exporting estimates")
+    scored = store.state[store.state["scored_day"] != NOT_SCORED]
+    output = store.summary(scored.index)[["customer_id", "monetary_value"]]
+    output = pd.concat([output[["customer_id"]], scored[["clv_estimate", "clv_estimate_hdi_3%", "clv_estimate_hdi_97%"]],
+                        output[["monetary_value"]]], axis=1)
+    output.to_csv(output_path, index=False)
+    return len(output)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental RFM update and CLV re-scoring")
+    parser.add_argument("transactions", nargs="+", help="CSV files with new invoices")
+    parser.add_argument("--store", required=True, help="parquet file holding the per-customer state")
+    parser.add_argument("--posterior", required=True, help="npz of posterior draws written by clv_scoring.save_posterior")
+    parser.add_argument("--output", default=None, help="write clv_estimates_output.csv style estimates here")
+    parser.add_argument("--init", action="store_true", help="start a new store instead of loading --store")
+    parser.add_argument("--date-format", default=None, help="strftime format of InvoiceDate, skips inference")
+    parser.add_argument("--max-age", type=int, default=None, help="also re-score customers whose score is older than this many days")
+    parser.add_argument("--time", type=int, default=120, help="CLV horizon in months")
+    parser.add_argument("--discount-rate", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=None, help="processes scoring customer blocks")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    store = RFMStore() if args.init else RFMStore.load(args.store)
+    posterior = load_posterior(args.posterior)
+
+    # cleaned exactly as rfm_builder.py builds the store: returns cancelled by the join, no price filter
+    touched = [store.update(clean_transactions(pd.read_csv(path, dtype=CSV_DTYPES), args.date_format))
+               for path in args.transactions]
+    customers = np.unique(np.concatenate(touched))
+    if args.init:
+        customers = store.state.index.to_numpy()
+    elif args.max_age is not None:
+        customers = np.union1d(customers, store.stale(args.max_age))
+
+    n_scored = refresh(store, posterior, customers, time=args.time, discount_rate=args.discount_rate,
+                       n_jobs=args.workers)
+    store.save(args.store)
+    if args.output:
+        export_estimates(store, args.output)
+    print(f"{n_scored}/{len(store.state)} customers re-scored in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,264 @@
+"""Closed-form BG/NBD and Gamma-Gamma scoring on saved posterior draws.
+
+The formulas are the ones behind pymc_marketing's BetaGeoModel and
+GammaGammaModel, evaluated on plain NumPy arrays of posterior draws so a fitted
+model can score customers without rebuilding the PyMC graph:
+
+    save_posterior("data/clv_posterior.npz", bgm, gg)   # after the full fit
+    posterior = load_posterior("data/clv_posterior.npz")
+    clv = customer_lifetime_value(posterior, frequency, recency, T, monetary_value, time=120)
+
+Every function returns a (draws, customers) array. For large customer bases,
+score_blocks / export_clv_estimates work through customer blocks and reduce
+each block over draws (mean and HDI) before moving on, so the full
+(draws, customers) tensor never exists:
+
+    python clv_scoring.py data/rfm_summary.csv data/clv_posterior.npz \
+        data/clv_estimates_output.csv --time 120 --workers 8
+
+trajectories() gives the churn-risk curves of every customer the same way:
+p_alive and expected purchases on a horizon grid as (customers, horizons)
+float32 matrices, computed in bounded blocks. --trajectories writes them to an
+npz in the same job (or alone, without the estimates output):
+
+    python clv_scoring.py data/rfm_summary.csv data/clv_posterior.npz \
+        --trajectories data/clv_trajectories.npz --horizons 0 30 60 90 180 360
+"""
+import argparse
+import os
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit, hyp2f1
+
+
+BG_NBD_PARAMS = ("a", "b", "alpha", "r")
+GAMMA_GAMMA_PARAMS = ("p", "q", "v")
+HDI_PROB = 0.94
+PERIODS_PER_MONTH = {"W": 4.345, "M": 1.0, "D": 30, "H": 30 * 24}
+BLOCK_SIZE = 2_000
+MAX_TRAJECTORY_BLOCK = 20_000_000
+TRAJECTORY_HORIZONS = np.arange(0, 361, 30)
+
+_posterior = None
+
+
+def save_posterior(path, transaction_model, spend_model=None):
+    # chains are flattened into one draw axis
+    draws = {name: transaction_model.idata.posterior[name].values.ravel() for name in BG_NBD_PARAMS}
+    if spend_model is not None:
+        draws.update({name: spend_model.idata.posterior[name].values.ravel() for name in GAMMA_GAMMA_PARAMS})
+    np.savez(path, **draws)
+
+def load_posterior(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+def _params(posterior, names):
+    # (draws, 1) columns so they broadcast against (customers,) inputs
+    return [np.asarray(posterior[name], dtype=np.float64)[:, None] for name in names]
+
+def _log_alive_odds(a, b, alpha, r, x, t_x, T):
+    # log of a/(b+x-1) ((alpha+T)/(alpha+t_x))^(r+x); the power overflows for frequent buyers
+    return (r + x) * (np.log(alpha + T) - np.log(alpha + t_x)) + np.log(a) - np.log(b + np.maximum(x, 1) - 1)
+
+def _purchases_if_alive(a, b, alpha, r, t, x, T):
+    # Euler's transformation 2F1(A, B; C; z) = (1-z)^(C-A-B) 2F1(C-A, C-B; C; z) turns
+    # ((alpha+T)/(alpha+T+t))^(r+x) 2F1(r+x, b+x; a+b+x-1; z) into
+    # ((alpha+T)/(alpha+T+t))^(a-1) 2F1(a+b-1-r, a-1; a+b+x-1; z), whose parameters no
+    # longer grow with the frequency x
+    log_ratio = np.log(alpha + T) - np.log(alpha + T + t)
+    hypergeometric = hyp2f1(a + b - 1 - r, a - 1, a + b + x - 1, t / (alpha + T + t))
+    return (a + b + x - 1) / (a - 1) * (1 - np.exp((a - 1) * log_ratio) * hypergeometric)
+
+def _alive(a, b, alpha, r, x, t_x, T):
+    return np.where(x > 0, expit(-_log_alive_odds(a, b, alpha, r, x, t_x, T)), 1.0)
+
+def expected_num_purchases(posterior, t, frequency, recency, T):
+    a, b, alpha, r = _params(posterior, BG_NBD_PARAMS)
+    x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T))
+    return _purchases_if_alive(a, b, alpha, r, t, x, T) * _alive(a, b, alpha, r, x, t_x, T)
+
+def probability_alive(posterior, frequency, recency, T):
+    a, b, alpha, r = _params(posterior, BG_NBD_PARAMS)
+    x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T))
+    return _alive(a, b, alpha, r, x, t_x, T)
+
+def expected_customer_spend(posterior, monetary_value, frequency):
+    p, q, v = _params(posterior, GAMMA_GAMMA_PARAMS)
+    x = np.asarray(frequency, dtype=np.float64)
+
+    individual_weight = p * x / (p * x + q - 1)
+    population_mean = v * p / (q - 1)
+    return (1 - individual_weight) * population_mean + individual_weight * np.asarray(monetary_value, dtype=np.float64)
+
+def customer_lifetime_value(posterior, frequency, recency, T, monetary_value, time=12, discount_rate=0.01, freq="D"):
+    # discounted monthly cash flows over `time` months, as pymc_marketing.clv.utils.customer_lifetime_value
+    steps = np.arange(time, time + 1) if discount_rate == 0.0 else np.arange(1, time + 1)
+    factor = PERIODS_PER_MONTH[freq]
+    a, b, alpha, r = _params(posterior, BG_NBD_PARAMS)
+    x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T))
+
+    # the probability of being alive is a common factor of every period's purchases
+    discounted = 0.0
+    previous = _purchases_if_alive(a, b, alpha, r, 0, x, T)
+    for t in steps * factor:
+        current = _purchases_if_alive(a, b, alpha, r, t, x, T)
+        discounted = discounted + (current - previous) / (1 + discount_rate) ** (t / factor)
+        previous = current
+    return expected_customer_spend(posterior, monetary_value, frequency) * _alive(a, b, alpha, r, x, t_x, T) * discounted
+
+def hdi(draws, prob=HDI_PROB):
+    # narrowest interval holding `prob` of the draws, per customer (arviz.hdi for unimodal draws)
+    ordered = np.sort(draws, axis=0)
+    n = ordered.shape[0]
+    width = int(np.floor(prob * n))
+    start = np.argmin(ordered[width:] - ordered[:n - width], axis=0)
+    columns = np.arange(ordered.shape[1])
+    return ordered[start, columns], ordered[start + width, columns]
+
+def summarize(draws, prob=HDI_PROB):
+    lower, upper = hdi(draws, prob)
+    return draws.mean(axis=0), lower, upper
+
+def _trajectory_block(posterior, x, t_x, T, horizons, since_last_purchase, prob):
+    # (draws, customers, horizons) arrays for one block of customers, reduced over draws
+    a, b, alpha, r = (param[..., None] for param in _params(posterior, BG_NBD_PARAMS))
+    x, t_x, T = x[:, None], t_x[:, None], T[:, None]
+    origin = t_x if since_last_purchase else T
+
+    draws = {
+        "p_alive": _alive(a, b, alpha, r, x, t_x, origin + horizons),
+        "expected_purchases": _purchases_if_alive(a, b, alpha, r, horizons, x, T) * _alive(a, b, alpha, r, x, t_x, T),
+    }
+    block = {}
+    for name, values in draws.items():
+        block[name] = values.mean(axis=0)
+        if prob is not None:
+            lower, upper = hdi(values.reshape(len(values), -1), prob)
+            block[f"{name}_lower"], block[f"{name}_upper"] = lower.reshape(x.shape[0], -1), upper.reshape(x.shape[0], -1)
+    return block
+
+def trajectories(posterior, frequency, recency, T, horizons, since_last_purchase=False, prob=None,
+                 max_block=MAX_TRAJECTORY_BLOCK):
+    # what-if curves for every customer as dense float32 (customers, horizons) matrices:
+    # p_alive after `horizons` more days without a purchase (counted from the last purchase
+    # with since_last_purchase, as the notebook's sample_customer_history) and the expected
+    # purchases over the next `horizons` days; prob adds HDI bounds
+    x, t_x, T = (np.asarray(v, dtype=np.float64) for v in (frequency, recency, T))
+    horizons = np.asarray(horizons, dtype=np.float64)
+    n_draws = len(next(iter(posterior.values())))
+    step = max(1, max_block // (n_draws * len(horizons)))
+
+    names = ["p_alive", "expected_purchases"]
+    if prob is not None:
+        names += [f"{name}_{bound}" for name in names for bound in ("lower", "upper")]
+    result = {name: np.empty((len(x), len(horizons)), dtype=np.float32) for name in names}
+    for start in range(0, len(x), step):
+        rows = slice(start, start + step)
+        block = _trajectory_block(posterior, x[rows], t_x[rows], T[rows], horizons, since_last_purchase, prob)
+        for name, values in block.items():
+            result[name][rows] = values
+    return result
+
+def thin(posterior, n_draws=None):
+    # evenly spaced subset of the draws; None keeps them all
+    n = len(next(iter(posterior.values())))
+    if n_draws is None or n_draws >= n:
+        return posterior
+    keep = np.linspace(0, n - 1, n_draws).round().astype(int)
+    return {name: values[keep] for name, values in posterior.items()}
+
+def score_block(block, posterior, t=365, time=12, discount_rate=0.01, freq="D", prob=HDI_PROB):
+    # block: clv_summary rows; every (draws, customers) array lives only inside this call
+    args = (block["frequency"].to_numpy(), block["recency"].to_numpy(), block["T"].to_numpy())
+    monetary_value = block["monetary_value"].to_numpy()
+    clv_mean, clv_lower, clv_upper = summarize(
+        customer_lifetime_value(posterior, *args, monetary_value, time, discount_rate, freq), prob)
+
+    return pd.DataFrame({
+        "customer_id": block["customer_id"].to_numpy(),
+        "expected_purchases": expected_num_purchases(posterior, t, *args).mean(axis=0),
+        "p_alive": probability_alive(posterior, *args).mean(axis=0),
+        "clv_estimate": clv_mean,
+        "clv_estimate_hdi_3%": clv_lower,
+        "clv_estimate_hdi_97%": clv_upper,
+        "monetary_value": monetary_value,
+    }, index=block.index)
+
+def _set_posterior(posterior):
+    global _posterior
+    _posterior = posterior
+
+def _score_block(block, kwargs):
+    return score_block(block, _posterior, **kwargs)
+
+def score_blocks(summary, posterior, block_size=BLOCK_SIZE, n_jobs=None, **kwargs):
+    # yields scored blocks in input order; blocks are spread over a process pool
+    blocks = (summary.iloc[start:start + block_size] for start in range(0, len(summary), block_size))
+    n_jobs = min(n_jobs or os.cpu_count() or 1, -(-len(summary) // block_size))
+
+    if n_jobs <= 1:
+        for block in blocks:
+            yield score_block(block, posterior, **kwargs)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_set_posterior, initargs=(posterior,)) as pool:
+        yield from pool.map(_score_block, blocks, (kwargs for _ in range(len(summary))))
+
+def score_summary(summary, posterior, **kwargs):
+    return pd.concat(list(score_blocks(summary, posterior, **kwargs)))
+
+def export_clv_estimates(summary, posterior, output_path, **kwargs):
+    # writes the columns of data/clv_estimates_output.csv block by block
+    columns = ["customer_id", "clv_estimate", "clv_estimate_hdi_3%", "clv_estimate_hdi_97%", "monetary_value"]
+    n_rows = 0
+    for i, scores in enumerate(score_blocks(summary, posterior, **kwargs)):
+        scores[columns].to_csv(output_path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        n_rows += len(scores)
+    return n_rows
+
+def export_trajectories(summary, posterior, output_path, horizons=TRAJECTORY_HORIZONS, **kwargs):
+    # one npz with customer_id, the horizon grid and a float32 (customers, horizons) matrix per curve
+    curves = trajectories(posterior, summary["frequency"], summary["recency"], summary["T"], horizons, **kwargs)
+    np.savez(output_path, customer_id=summary["customer_id"].to_numpy(),
+             horizons=np.asarray(horizons, dtype=np.float32), **curves)
+    return len(summary)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Block-wise CLV scoring from saved posterior draws")
+    parser.add_argument("summary", help="CSV with customer_id, frequency, recency, T, monetary_value")
+    parser.add_argument("posterior", help="npz written by save_posterior")
+    parser.add_argument("output", nargs="?", default=None, help="clv_estimates_output.csv style estimates")
+    parser.add_argument("--time", type=int, default=120, help="CLV horizon in months")
+    parser.add_argument("--discount-rate", type=float, default=0.01)
+    parser.add_argument("--freq", default="D", choices=list(PERIODS_PER_MONTH))
+    parser.add_argument("--draws", type=int, default=None, help="thin the posterior to this many draws")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--trajectories", default=None, help="also write p_alive / expected purchase curves here (npz)")
+    parser.add_argument("--horizons", type=int, nargs="+", default=TRAJECTORY_HORIZONS.tolist(), help="horizon grid in days")
+    parser.add_argument("--since-last-purchase", action="store_true", help="count p_alive horizons from the last purchase")
+    parser.add_argument("--hdi", type=float, default=None, help="add HDI bounds of this probability to the curves")
+    args = parser.parse_args(argv)
+    if args.output is None and args.trajectories is None:
+        parser.error("give an output path, --trajectories, or both")
+
+    start = timer.perf_counter()
+    summary = pd.read_csv(args.summary)
+    posterior = thin(load_posterior(args.posterior), args.draws)
+    if args.output:
+        n_rows = export_clv_estimates(summary, posterior, args.output, block_size=args.block_size, n_jobs=args.workers,
+                                      time=args.time, discount_rate=args.discount_rate, freq=args.freq)
+        print(f"{n_rows} customers scored in {timer.perf_counter() - start:.2f}s")
+    if args.trajectories:
+        n_rows = export_trajectories(summary, posterior, args.trajectories, args.horizons,
+                                     since_last_purchase=args.since_last_purchase, prob=args.hdi)
+        print(f"{n_rows} customer trajectories over {len(args.horizons)} horizons in {timer.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
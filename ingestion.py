@@ -0,0 +1,101 @@
+"""Chunked upload reading shared by the Factor-analysis and Conjoint-analysis apps.
+
+CSV uploads are read in CHUNK_SIZE-row chunks; Parquet and Arrow IPC uploads are
+read batch by batch through pyarrow without CSV parsing. read_file narrows every
+chunk as it arrives and, once all chunks are seen, casts them to one dtype map
+computed from the whole file, so pd.concat never upcasts them back.
+"""
+import numpy as np
+import pandas as pd
+
+
+CHUNK_SIZE = 100_000
+COLUMNAR_SUFFIXES = (".parquet", ".pq", ".arrow", ".feather")
+INTEGER_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def is_columnar(file_path):
+    name = getattr(file_path, "name", file_path)
+    return str(name).lower().endswith(COLUMNAR_SUFFIXES)
+
+def read_chunks(file_path, chunksize=CHUNK_SIZE):
+    if hasattr(file_path, "seek"):
+        file_path.seek(0)
+
+    if not is_columnar(file_path):
+        yield from pd.read_csv(file_path, index_col=0, chunksize=chunksize)
+        return
+
+    # columnar uploads are handed to pyarrow batch by batch, no CSV parsing
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    name = str(getattr(file_path, "name", file_path)).lower()
+    if name.endswith((".parquet", ".pq")):
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        reader = pa.ipc.open_file(file_path)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).to_pandas()
+
+def column_stats(chunk):
+    # per numeric column: min, max, null count, whether every value is a whole number
+    # and whether every value survives a round trip through float32
+    values = chunk.select_dtypes(include=["number", "bool"]).astype(np.float64)
+    return pd.DataFrame({
+        "min": values.min(),
+        "max": values.max(),
+        "nulls": values.isna().sum(),
+        "integral": ((values % 1 == 0) | values.isna()).all(),
+        "float32": ((values.astype(np.float32) == values) | values.isna()).all(),
+    })
+
+def merge_stats(stats, chunk_stats):
+    if stats is None:
+        return chunk_stats
+    return pd.DataFrame({
+        "min": np.fmin(stats["min"], chunk_stats["min"]),
+        "max": np.fmax(stats["max"], chunk_stats["max"]),
+        "nulls": stats["nulls"] + chunk_stats["nulls"],
+        "integral": stats["integral"] & chunk_stats["integral"],
+        "float32": stats["float32"] & chunk_stats["float32"],
+    })
+
+def dtype_map(stats, binary=False, floats=True):
+    # complete whole-number columns get the smallest signed integer (Likert items: int8),
+    # or uint8 for 0/1 dummies when binary; the rest float32 when floats and every value
+    # is exact in float32, else float64
+    dtypes = {}
+    for col, row in stats.iterrows():
+        if row["nulls"] == 0 and row["integral"] and not np.isnan(row["min"]):
+            if binary and row["min"] >= 0 and row["max"] <= 1:
+                dtypes[col] = np.uint8
+            else:
+                dtypes[col] = next(dtype for dtype in INTEGER_DTYPES
+                                   if np.iinfo(dtype).min <= row["min"] and row["max"] <= np.iinfo(dtype).max)
+        else:
+            dtypes[col] = np.float32 if floats and row["float32"] else np.float64
+    return dtypes
+
+def narrow_dtypes(df, binary=False, floats=True):
+    return df.astype(dtype_map(column_stats(df), binary, floats))
+
+def read_file(file_path, binary=False, floats=True, chunksize=CHUNK_SIZE):
+    # the whole upload with narrowed dtypes; per-column null counts are kept in attrs
+    chunks = []
+    stats = None
+    null_counts = None
+    for chunk in read_chunks(file_path, chunksize):
+        counts = chunk.isnull().sum()
+        null_counts = counts if null_counts is None else null_counts.add(counts, fill_value=0)
+        chunk_stats = column_stats(chunk)
+        stats = merge_stats(stats, chunk_stats)
+        # narrowed right away to bound memory; a chunk only gets float32 or an integer dtype
+        # when its values are exact in it, and the final dtype widens to hold every chunk
+        chunks.append(chunk.astype(dtype_map(chunk_stats, binary, floats)))
+
+    dtypes = dtype_map(stats, binary, floats)
+    df = pd.concat([chunk.astype(dtypes) for chunk in chunks])
+    df.attrs["null_counts"] = {col: int(n) for col, n in null_counts.items()}
+    return df
@@ -0,0 +1,147 @@
+"""Build the clv_summary table (frequency, recency, T, monetary_value) straight
+from raw Online Retail style transaction files, without loading the log.
+
+    # one file (or several, in order) sorted by CustomerID
+    python rfm_builder.py data/online_retail_sorted.csv --output data/rfm_summary.parquet
+
+    # files partitioned by customer: every customer's rows live in one file
+    python rfm_builder.py parts/*.parquet --partitioned --workers 8 \
+        --output data/rfm_summary.parquet --store data/rfm_state.parquet
+
+Returns are cancelled as in CustomerLifetimeValue.ipynb: invoices starting with
+"C" are dropped, together with every order line of the same customer whose
+(CustomerID, StockCode, Quantity, UnitPrice) matches a cancellation line with
+its quantity negated. Customers are complete within a partition, so the join
+and the per-customer aggregation run partition by partition on a process pool.
+--store writes the per-customer state used by clv_refresh.py.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from clv_refresh import CSV_DTYPES, STATE_COLUMNS, RFMStore, clean_transactions, customer_state
+
+
+COLUMNS = ["InvoiceNo", "StockCode", "Quantity", "InvoiceDate", "UnitPrice", "CustomerID"]
+COLUMNAR_SUFFIXES = (".parquet", ".pq")
+CHUNK_SIZE = 500_000
+
+
+def read_chunks(path, chunksize=CHUNK_SIZE):
+    if str(path).lower().endswith(COLUMNAR_SUFFIXES):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=COLUMNS):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=COLUMNS, dtype=CSV_DTYPES, chunksize=chunksize)
+
+def partition_state(transactions, date_format=None):
+    # STATE_COLUMNS for rows holding complete customers
+    return customer_state(clean_transactions(transactions, date_format)).astype(STATE_COLUMNS)
+
+def _file_state(path, date_format):
+    return partition_state(pd.concat(read_chunks(path), ignore_index=True), date_format)
+
+def sorted_partitions(chunks):
+    # regroups a customer-sorted chunk stream so no customer is split between partitions
+    carry = None
+    for chunk in chunks:
+        chunk = chunk[chunk["CustomerID"].notna()]
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+
+        customers = chunk["CustomerID"].to_numpy()
+        if np.any(customers[1:] < customers[:-1]):
+            raise ValueError("transactions are not sorted by CustomerID; sort them or pass partitioned files")
+        boundary = np.searchsorted(customers, customers[-1], side="left")
+        carry = chunk.iloc[boundary:]
+        if boundary:
+            yield chunk.iloc[:boundary]
+    if carry is not None and len(carry):
+        yield carry
+
+def _compact_keys(index):
+    # int32 customer ids when they fit, categorical codes for anything else
+    values = index.to_numpy()
+    if len(values) == 0:
+        return index
+    if pd.api.types.is_numeric_dtype(values) and np.all(values % 1 == 0):
+        info = np.iinfo(np.int32)
+        dtype = np.int32 if (values.min() >= info.min and values.max() <= info.max) else np.int64
+        return pd.Index(values.astype(dtype), name="customer_id")
+    return pd.CategoricalIndex(values, name="customer_id")
+
+def build_state(paths, partitioned=False, chunksize=CHUNK_SIZE, n_jobs=None, date_format=None):
+    # per-customer STATE_COLUMNS over all files; sorted input is streamed chunk by chunk
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if partitioned:
+        if n_jobs <= 1:
+            states = [_file_state(path, date_format) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                states = list(pool.map(_file_state, paths, [date_format] * len(paths)))
+    else:
+        partitions = sorted_partitions(chain.from_iterable(read_chunks(path, chunksize) for path in paths))
+        if n_jobs <= 1:
+            states = [partition_state(partition, date_format) for partition in partitions]
+        else:
+            # the parent parses, workers join and aggregate; at most 2 partitions per worker wait in memory
+            states, pending = [], deque()
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                for partition in partitions:
+                    pending.append(pool.submit(partition_state, partition, date_format))
+                    if len(pending) >= 2 * n_jobs:
+                        states.append(pending.popleft().result())
+                states.extend(future.result() for future in pending)
+
+    state = pd.concat(states) if states else RFMStore().state
+    if state.index.has_duplicates:
+        raise ValueError("a customer appears in more than one partition")
+    state.index = _compact_keys(state.index)
+    return state
+
+def build_store(paths, **kwargs):
+    state = build_state(paths, **kwargs)
+    return RFMStore(state, int(state["last_day"].max()) if len(state) else None)
+
+def build_summary(paths, **kwargs):
+    # same columns as pymc_marketing.clv.utils.clv_summary on the notebook's cleaned data
+    return build_store(paths, **kwargs).summary()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming RFM summary for the CLV models")
+    parser.add_argument("transactions", nargs="+", help="CSV or parquet transaction files")
+    parser.add_argument("--output", required=True, help="clv_summary table (.csv or .parquet)")
+    parser.add_argument("--store", default=None, help="also write the clv_refresh.py state store here")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="files hold disjoint sets of customers (default: one stream sorted by CustomerID)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--date-format", default=None, help="strftime format of InvoiceDate, skips inference")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    store = build_store(args.transactions, partitioned=args.partitioned, chunksize=args.chunksize,
+                        n_jobs=args.workers, date_format=args.date_format)
+    summary = store.summary()
+    if args.output.lower().endswith(COLUMNAR_SUFFIXES):
+        summary.to_parquet(args.output, index=False)
+    else:
+        summary.to_csv(args.output, index=False)
+    if args.store:
+        store.save(args.store)
+    print(f"{len(summary)} customers summarised in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,277 @@
+"""K-means customer segmentation for large customer tables.
+
+    # elbow and silhouette for k = 1..10, one k per process
+    python segmentation.py sweep sample_data/Mall_Customers.csv \
+        --columns "Annual Income (k$)" "Spending Score (1-100)" --output data/k_sweep.csv
+
+    # fit the chosen k and keep its centroids
+    python segmentation.py fit sample_data/Mall_Customers.csv \
+        --columns "Annual Income (k$)" "Spending Score (1-100)" --n-clusters 5 \
+        --centroids data/segments.npz
+
+    # nightly: nearest-centroid assignment of new customers
+    python segmentation.py assign new_customers.csv --centroids data/segments.npz \
+        --id-column CustomerID --output data/segments.csv
+
+    # value segments from the RFM summary and the CLV estimates
+    python segmentation.py value data/rfm_summary.parquet data/clv_estimates_output.csv \
+        --n-clusters 5 --centroids data/value_segments.npz --output data/value_segments.csv
+
+Inputs up to LARGE_INPUT rows use KMeans as Customer_segmentation.ipynb does.
+Larger ones are streamed through MiniBatchKMeans.partial_fit in STREAM_CHUNK-row
+chunks, with labels and inertia from one chunked nearest-centroid pass. The
+silhouette score is computed on a random sample of SILHOUETTE_SAMPLE rows. For
+a parallel sweep the feature matrix is written once to a temporary .npy file,
+which every worker memory-maps instead of receiving a pickled copy.
+
+The value stage fills one float32 matrix from the RFM and CLV columns and
+log-transforms and standardises it in place. The transform is saved with the
+centroids, so assign repeats it on new customers.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+
+LARGE_INPUT = 100_000
+BATCH_SIZE = 4_096
+SILHOUETTE_SAMPLE = 10_000
+ASSIGN_CHUNK = 1_000_000
+STREAM_CHUNK = 50_000
+
+# clv_summary columns and data/clv_estimates_output.csv columns
+RFM_COLUMNS = ["frequency", "recency", "T", "monetary_value"]
+VALUE_FEATURES = ["frequency", "recency", "T", "monetary_value", "clv_estimate"]
+LOG_FEATURES = ["frequency", "monetary_value", "clv_estimate"]
+
+_features = None
+
+
+def read_columns(path, columns):
+    if str(path).lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(path, columns=list(columns))
+    return pd.read_csv(path, usecols=list(columns))
+
+def load_features(path, columns, id_column=None):
+    # float32 feature matrix (and ids) from a csv/parquet table
+    columns = list(columns)
+    df = read_columns(path, columns + ([id_column] if id_column else []))
+    features = np.ascontiguousarray(df[columns].to_numpy(dtype=np.float32))
+    return features, (df[id_column].to_numpy() if id_column else None)
+
+def value_features(summary, clv, columns=VALUE_FEATURES):
+    # one float32 (customers, features) matrix from the RFM summary and the CLV estimates,
+    # joined on customer_id by position; customers without a CLV estimate are left out
+    ids = summary["customer_id"].to_numpy()
+    positions = pd.Index(clv["customer_id"]).get_indexer(ids)
+    rows = np.flatnonzero(positions >= 0)
+
+    features = np.empty((len(rows), len(columns)), dtype=np.float32)
+    for j, col in enumerate(columns):
+        if col in summary:
+            features[:, j] = summary[col].to_numpy()[rows]
+        else:
+            features[:, j] = clv[col].to_numpy()[positions[rows]]
+    return ids[rows], features
+
+def preprocess(features, log_mask, center=None, scale=None):
+    # log1p of the skewed columns and standardisation, both in place; pass the saved
+    # center/scale to repeat the training transform on new customers
+    for j in np.flatnonzero(log_mask):
+        column = features[:, j]
+        np.maximum(column, 0, out=column)
+        np.log1p(column, out=column)
+    if center is None:
+        center = features.mean(axis=0, dtype=np.float64)
+        scale = features.std(axis=0, dtype=np.float64)
+        scale[scale == 0] = 1
+    features -= center.astype(np.float32)
+    features /= scale.astype(np.float32)
+    return {"center": center, "scale": scale, "log_mask": np.asarray(log_mask, dtype=bool)}
+
+def segment_profiles(centroids, preprocessing, columns):
+    # centroids back in the original units
+    profiles = np.asarray(centroids, dtype=np.float64) * preprocessing["scale"] + preprocessing["center"]
+    profiles[:, preprocessing["log_mask"]] = np.expm1(profiles[:, preprocessing["log_mask"]])
+    return pd.DataFrame(profiles, columns=list(columns), index=pd.RangeIndex(1, len(profiles) + 1, name="cluster_id"))
+
+def value_segments(summary, clv, n_clusters, columns=VALUE_FEATURES, log_columns=LOG_FEATURES, seed=0):
+    # RFM + CLV segmentation: segment table keyed by customer_id, centroid profiles, and
+    # the fitted centroids with their preprocessing for save_centroids
+    ids, features = value_features(summary, clv, columns)
+    preprocessing = preprocess(features, np.isin(columns, log_columns))
+    result = fit_kmeans(features, n_clusters, seed)
+
+    labels = assign(features, result["centroids"])
+    segments = pd.DataFrame({"customer_id": ids, "cluster_id": labels + 1})
+    profiles = segment_profiles(result["centroids"], preprocessing, columns)
+    profiles.insert(0, "customers", np.bincount(labels, minlength=n_clusters))
+    return segments, profiles, {"centroids": result["centroids"], **preprocessing}
+
+def make_model(n_clusters, n_rows, seed=0):
+    if n_rows <= LARGE_INPUT:
+        return KMeans(n_clusters=n_clusters, n_init="auto", random_state=seed)
+    return MiniBatchKMeans(n_clusters=n_clusters, batch_size=BATCH_SIZE, n_init="auto", random_state=seed)
+
+def fit_kmeans(features, n_clusters, seed=0, silhouette_sample=SILHOUETTE_SAMPLE, chunk_size=STREAM_CHUNK):
+    start = time.perf_counter()
+    model = make_model(n_clusters, len(features), seed)
+    if isinstance(model, KMeans):
+        model.fit(features)
+        labels, inertia = model.labels_, float(model.inertia_)
+    else:
+        # streaming: one partial_fit pass over row chunks, then one nearest-centroid pass for
+        # labels and inertia, so a memory-mapped matrix is never loaded whole
+        for offset in range(0, len(features), chunk_size):
+            model.partial_fit(np.asarray(features[offset:offset + chunk_size], dtype=np.float32))
+        labels, inertia = _nearest_centroid(features, model.cluster_centers_, chunk_size)
+
+    silhouette = np.nan
+    if 1 < n_clusters < len(features):
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(features), min(silhouette_sample, len(features)), replace=False))
+        if len(np.unique(labels[sample])) > 1:
+            silhouette = silhouette_score(np.asarray(features[sample]), labels[sample])
+    return {
+        "k": n_clusters,
+        "inertia": inertia,
+        "silhouette": float(silhouette),
+        "seconds": time.perf_counter() - start,
+        "centroids": model.cluster_centers_.astype(np.float32),
+    }
+
+def _set_features(features):
+    # workers map a .npy path instead of receiving a pickled copy of the matrix
+    global _features
+    _features = np.load(features, mmap_mode="r") if isinstance(features, str) else features
+
+def _fit_k(n_clusters, seed, silhouette_sample):
+    return fit_kmeans(_features, n_clusters, seed, silhouette_sample)
+
+def k_sweep(features, ks=range(1, 11), n_jobs=None, seed=0, silhouette_sample=SILHOUETTE_SAMPLE):
+    # inertia (elbow) and sampled silhouette per k; returns the table and {k: centroids}.
+    # features: a matrix or the path of a .npy file; a matrix is written to a temporary
+    # .npy first so the workers memory-map it
+    ks = list(ks)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(ks))
+    args = ([seed] * len(ks), [silhouette_sample] * len(ks))
+    if n_jobs <= 1:
+        _set_features(features)
+        results = list(map(_fit_k, ks, *args))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            if not isinstance(features, str):
+                path = os.path.join(tmp, "features.npy")
+                np.save(path, np.asarray(features, dtype=np.float32))
+                features = path
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_set_features, initargs=(features,)) as pool:
+                results = list(pool.map(_fit_k, ks, *args))
+
+    centroids = {result["k"]: result.pop("centroids") for result in results}
+    return pd.DataFrame(results).set_index("k"), centroids
+
+def save_centroids(path, centroids, columns, **preprocessing):
+    # preprocessing arrays (e.g. center, scale) are stored alongside so assignment repeats them
+    np.savez(path, centroids=np.asarray(centroids, dtype=np.float32), columns=np.asarray(columns), **preprocessing)
+
+def load_centroids(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+def _nearest_centroid(features, centroids, chunk_size=ASSIGN_CHUNK):
+    # nearest centroid by ||x||^2 - 2 x.c + ||c||^2, chunk by chunk; int32 labels and the inertia
+    centroids = np.asarray(centroids, dtype=np.float32)
+    centroid_norms = np.einsum("kp,kp->k", centroids, centroids)
+    labels = np.empty(len(features), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(features), chunk_size):
+        block = np.asarray(features[start:start + chunk_size], dtype=np.float32)
+        distances = centroid_norms - 2 * block @ centroids.T
+        nearest = distances.argmin(axis=1)
+        labels[start:start + chunk_size] = nearest
+        inertia += float(np.einsum("np,np->", block, block, dtype=np.float64)
+                         + distances[np.arange(len(block)), nearest].sum(dtype=np.float64))
+    return labels, inertia
+
+def assign(features, centroids, chunk_size=ASSIGN_CHUNK):
+    return _nearest_centroid(features, centroids, chunk_size)[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="K-means customer segmentation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sweep = commands.add_parser("sweep", help="inertia and silhouette over a range of k")
+    sweep.add_argument("input")
+    sweep.add_argument("--columns", nargs="+", required=True)
+    sweep.add_argument("--k-min", type=int, default=1)
+    sweep.add_argument("--k-max", type=int, default=10)
+    sweep.add_argument("--output", default=None)
+    sweep.add_argument("--workers", type=int, default=None)
+
+    fit = commands.add_parser("fit", help="fit one k and save its centroids")
+    fit.add_argument("input")
+    fit.add_argument("--columns", nargs="+", required=True)
+    fit.add_argument("--n-clusters", type=int, required=True)
+    fit.add_argument("--centroids", required=True)
+
+    assign_parser = commands.add_parser("assign", help="label customers with the nearest saved centroid")
+    assign_parser.add_argument("input")
+    assign_parser.add_argument("--centroids", required=True)
+    assign_parser.add_argument("--id-column", required=True)
+    assign_parser.add_argument("--output", required=True)
+
+    value = commands.add_parser("value", help="segments from the RFM summary and the CLV estimates")
+    value.add_argument("summary", help="clv_summary table (rfm_builder.py output)")
+    value.add_argument("clv", help="CLV estimates (data/clv_estimates_output.csv layout)")
+    value.add_argument("--n-clusters", type=int, required=True)
+    value.add_argument("--columns", nargs="+", default=VALUE_FEATURES)
+    value.add_argument("--log-columns", nargs="*", default=LOG_FEATURES)
+    value.add_argument("--centroids", default=None)
+    value.add_argument("--output", required=True, help="segment table keyed by customer_id")
+
+    for command in (sweep, fit, value):
+        command.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "sweep":
+        features, _ = load_features(args.input, args.columns)
+        table, _ = k_sweep(features, range(args.k_min, args.k_max + 1), args.workers, args.seed)
+        print(table.to_string())
+        if args.output:
+            table.to_csv(args.output)
+    elif args.command == "fit":
+        features, _ = load_features(args.input, args.columns)
+        result = fit_kmeans(features, args.n_clusters, args.seed)
+        save_centroids(args.centroids, result["centroids"], args.columns)
+        print(f"k={args.n_clusters}: inertia {result['inertia']:.4g}, silhouette {result['silhouette']:.3f}")
+    elif args.command == "value":
+        summary_columns = ["customer_id"] + [col for col in args.columns if col in RFM_COLUMNS]
+        summary = read_columns(args.summary, summary_columns)
+        clv = read_columns(args.clv, ["customer_id"] + [col for col in args.columns if col not in summary_columns])
+        segments, profiles, model = value_segments(summary, clv, args.n_clusters, args.columns, args.log_columns, args.seed)
+        segments.to_csv(args.output, index=False)
+        if args.centroids:
+            save_centroids(args.centroids, model.pop("centroids"), args.columns, **model)
+        print(profiles.to_string())
+    else:
+        saved = load_centroids(args.centroids)
+        features, ids = load_features(args.input, saved["columns"], args.id_column)
+        if "center" in saved:
+            preprocess(features, saved["log_mask"], saved["center"], saved["scale"])
+        labels = assign(features, saved["centroids"])
+        pd.DataFrame({args.id_column: ids, "cluster_id": labels + 1}).to_csv(args.output, index=False)
+        print(f"{len(labels)} customers assigned to {len(saved['centroids'])} segments")
+    print(f"done in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import clv_model_selection as selection
+from clv_scoring import BG_NBD_PARAMS, GAMMA_GAMMA_PARAMS, customer_lifetime_value, load_posterior
+
+
+def simulate_bgnbd(n_customers, T, a=0.8, b=2.5, alpha=20.0, r=0.6, seed=0):
+    # purchase days of a BG/NBD population: Poisson(lambda) purchases, dropping out
+    # with probability p right after each one
+    rng = np.random.default_rng(seed)
+    lam = rng.gamma(r, 1 / alpha, n_customers)
+    p = rng.beta(a, b, n_customers)
+    x, t_x = np.zeros(n_customers), np.zeros(n_customers)
+    for i in range(n_customers):
+        t = rng.exponential(1 / lam[i])
+        while t <= T:
+            x[i], t_x[i] = x[i] + 1, t
+            if rng.random() < p[i]:
+                break
+            t += rng.exponential(1 / lam[i])
+    return pd.DataFrame({"frequency": x, "recency": t_x, "T": np.full(n_customers, float(T))})
+
+def transaction_file(path, n_customers=300, seed=0):
+    # Online Retail style invoices over one year, a few purchase days per customer
+    rng = np.random.default_rng(seed)
+    rows = []
+    for customer in range(12000, 12000 + n_customers):
+        first = rng.integers(0, 200)
+        days = np.unique(np.concatenate([[first], first + rng.integers(0, 365 - first, rng.poisson(3))]))
+        for day in days:
+            rows.append({"InvoiceNo": str(rng.integers(500000, 600000)), "StockCode": "85123A",
+                         "Quantity": int(rng.integers(1, 6)), "UnitPrice": float(rng.choice([1.25, 2.55, 4.95])),
+                         "InvoiceDate": pd.Timestamp("2011-01-01") + pd.Timedelta(days=int(day)),
+                         "CustomerID": customer})
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def test_map_recovers_bgnbd_parameters():
+    summary = simulate_bgnbd(4000, T=300)
+    draws = selection.fit_map("bgnbd", selection.rfm_patterns(summary))
+    estimate = np.array([draws[param][0] for param in ("a", "b", "alpha", "r")])
+    np.testing.assert_allclose(estimate, [0.8, 2.5, 20.0, 0.6], rtol=0.35)
+
+def test_map_screening_compares_every_model(tmp_path):
+    path = transaction_file(tmp_path / "transactions.csv")
+    output = tmp_path / "comparison.csv"
+    assert selection.main([str(path), "--calibration-end", "2011-09-01", "--workers", "1",
+                           "--output", str(output)]) == 0
+    comparison = pd.read_csv(output, index_col=0)
+    assert set(comparison.index) == set(selection.MODELS)
+    assert np.isfinite(comparison["holdout_rmse"]).all()
+
+def test_advi_smoke():
+    pytest.importorskip("pymc")
+    patterns = selection.rfm_patterns(simulate_bgnbd(200, T=300))
+    draws = selection.fit_advi("bgnbd", patterns, n_iter=200, draws=10)
+    assert all(draws[param].shape == (10,) for param in BG_NBD_PARAMS)
+
+def test_nuts_posterior_loads_for_scoring(tmp_path):
+    pytest.importorskip("pymc")
+    path = transaction_file(tmp_path / "transactions.csv")
+    posterior_path = tmp_path / "posterior.npz"
+    assert selection.main([str(path), "--calibration-end", "2011-09-01", "--workers", "1", "--nuts",
+                           "--draws", "20", "--tune", "20", "--chains", "1",
+                           "--posterior", str(posterior_path)]) == 0
+
+    posterior = load_posterior(posterior_path)
+    assert set(BG_NBD_PARAMS + GAMMA_GAMMA_PARAMS) <= set(posterior)
+    clv = customer_lifetime_value(posterior, np.array([2.0]), np.array([30.0]), np.array([90.0]),
+                                  np.array([20.0]), time=12)
+    assert np.isfinite(clv).all()
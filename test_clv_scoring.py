@@ -0,0 +1,64 @@
+import numpy as np
+from scipy.special import hyp2f1
+
+from clv_scoring import customer_lifetime_value, expected_num_purchases, probability_alive
+
+
+POSTERIOR = {
+    "a": np.array([0.8, 1.2, 2.0]),
+    "b": np.array([2.5, 3.0, 6.0]),
+    "alpha": np.array([20.0, 35.0, 60.0]),
+    "r": np.array([0.6, 0.9, 1.4]),
+    "p": np.array([6.0, 7.5, 9.0]),
+    "q": np.array([4.0, 3.5, 5.0]),
+    "v": np.array([15.0, 20.0, 30.0]),
+}
+FREQUENCY = np.array([0.0, 1.0, 3.0, 12.0])
+RECENCY = np.array([0.0, 40.0, 150.0, 280.0])
+T = np.array([90.0, 200.0, 300.0, 320.0])
+
+
+def reference_alive(a, b, alpha, r, x, t_x, T):
+    # Fader, Hardie and Lee (2005), eq. (13)
+    if x == 0:
+        return 1.0
+    return 1 / (1 + a / (b + x - 1) * ((alpha + T) / (alpha + t_x)) ** (r + x))
+
+def reference_purchases(a, b, alpha, r, t, x, t_x, T):
+    # Fader, Hardie and Lee (2005), eq. (10), with the unrearranged hypergeometric term
+    z = t / (alpha + T + t)
+    term = 1 - ((alpha + T) / (alpha + T + t)) ** (r + x) * hyp2f1(r + x, b + x, a + b + x - 1, z)
+    return (a + b + x - 1) / (a - 1) * term * reference_alive(a, b, alpha, r, x, t_x, T)
+
+def reference_spend(p, q, v, x, m):
+    # Fader, Hardie and Lee (2005b), Gamma-Gamma conditional mean spend
+    return (q - 1) / (p * x + q - 1) * v * p / (q - 1) + p * x / (p * x + q - 1) * m
+
+
+def test_closed_forms_match_the_paper():
+    draws = list(zip(*(POSTERIOR[name] for name in ("a", "b", "alpha", "r"))))
+    alive = probability_alive(POSTERIOR, FREQUENCY, RECENCY, T)
+    purchases = expected_num_purchases(POSTERIOR, 90, FREQUENCY, RECENCY, T)
+    for d, (a, b, alpha, r) in enumerate(draws):
+        for i, (x, t_x, t_end) in enumerate(zip(FREQUENCY, RECENCY, T)):
+            assert np.isclose(alive[d, i], reference_alive(a, b, alpha, r, x, t_x, t_end))
+            assert np.isclose(purchases[d, i], reference_purchases(a, b, alpha, r, 90, x, t_x, t_end))
+
+def test_lifetime_value_matches_discounted_monthly_purchases():
+    monetary = np.array([0.0, 25.0, 18.0, 40.0])
+    clv = customer_lifetime_value(POSTERIOR, FREQUENCY, RECENCY, T, monetary, time=6, discount_rate=0.01)
+
+    for d in range(3):
+        a, b, alpha, r, p, q, v = (POSTERIOR[name][d] for name in ("a", "b", "alpha", "r", "p", "q", "v"))
+        for i, (x, t_x, t_end) in enumerate(zip(FREQUENCY, RECENCY, T)):
+            expected = 0.0
+            for month in range(1, 7):
+                purchases = (reference_purchases(a, b, alpha, r, 30 * month, x, t_x, t_end)
+                             - reference_purchases(a, b, alpha, r, 30 * (month - 1), x, t_x, t_end))
+                expected += purchases / 1.01 ** month
+            expected *= reference_spend(p, q, v, x, monetary[i])
+            assert np.isclose(clv[d, i], expected)
+
+def test_alive_odds_do_not_overflow_for_frequent_buyers():
+    alive = probability_alive(POSTERIOR, np.array([400.0]), np.array([100.0]), np.array([365.0]))
+    assert np.all(np.isfinite(alive)) and np.all(alive < 1e-6)
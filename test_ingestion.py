@@ -0,0 +1,25 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from ingestion import read_file
+
+
+def test_large_integers_with_nulls_keep_float64():
+    csv = "id,big,likert\n0,123456789,1\n1,123456790,2\n2,123456791,\n3,,4\n"
+    df = read_file(io.StringIO(csv), chunksize=2)
+
+    assert df["big"].dtype == np.float64
+    np.testing.assert_array_equal(df["big"].to_numpy()[:3], [123456789, 123456790, 123456791])
+    assert df["likert"].dtype == np.float32
+    assert df.attrs["null_counts"] == {"big": 1, "likert": 1}
+
+def test_chunks_share_one_dtype_map():
+    values = np.arange(1, 301)
+    csv = pd.DataFrame({"item": values % 6 + 1, "wide": values * 1000}).to_csv()
+    df = read_file(io.StringIO(csv), chunksize=50)
+
+    assert df["item"].dtype == np.int8
+    assert df["wide"].dtype == np.int32
+    np.testing.assert_array_equal(df["wide"].to_numpy(), values * 1000)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from rfm_builder import build_summary
+
+
+def transactions(n_customers=60, seed=0):
+    # Online Retail style lines with same-day repeats, cancellations and missing customers
+    rng = np.random.default_rng(seed)
+    rows = []
+    for customer in range(13000, 13000 + n_customers):
+        for _ in range(rng.integers(1, 8)):
+            day = pd.Timestamp("2011-01-03") + pd.Timedelta(days=int(rng.integers(0, 300)), hours=int(rng.integers(8, 18)))
+            line = {"InvoiceNo": str(rng.integers(540000, 580000)), "StockCode": str(rng.choice(["22423", "85123A", "47566"])),
+                    "Quantity": int(rng.integers(1, 12)), "InvoiceDate": day,
+                    "UnitPrice": float(rng.choice([0.85, 2.55, 4.95])), "CustomerID": float(customer)}
+            rows.append(line)
+            if rng.random() < 0.1:
+                rows.append({**line, "InvoiceNo": "C" + line["InvoiceNo"], "Quantity": -line["Quantity"]})
+    rows.append({**rows[0], "CustomerID": np.nan})
+    return pd.DataFrame(rows).sort_values(["CustomerID", "InvoiceDate"], kind="stable")
+
+def reference_summary(data):
+    # the notebook's cancellation merge, then clv_summary's daily aggregation
+    cancelled = data[data["InvoiceNo"].str.startswith("C")].copy()
+    cancelled["Quantity"] = -cancelled["Quantity"]
+    merged = pd.merge(data, cancelled[["CustomerID", "StockCode", "Quantity", "UnitPrice"]],
+                      on=["CustomerID", "StockCode", "Quantity", "UnitPrice"], how="left", indicator=True)
+    kept = merged[(merged["_merge"] == "left_only") & ~merged["InvoiceNo"].str.startswith("C")]
+    kept = kept[kept["CustomerID"].notna()].assign(day=lambda d: d["InvoiceDate"].dt.floor("D"),
+                                                   sales=lambda d: d["Quantity"] * d["UnitPrice"])
+
+    daily = kept.groupby(["CustomerID", "day"])["sales"].sum().reset_index()
+    end = daily["day"].max()
+    grouped = daily.groupby("CustomerID")
+    first, last = grouped["day"].min(), grouped["day"].max()
+    frequency = grouped.size() - 1
+    repeat = daily[daily["day"] != daily["CustomerID"].map(first)].groupby("CustomerID")["sales"].mean()
+    return pd.DataFrame({
+        "frequency": frequency.astype(float),
+        "recency": (last - first).dt.days.astype(float),
+        "T": (end - first).dt.days.astype(float),
+        "monetary_value": repeat.reindex(frequency.index).fillna(0.0),
+    })
+
+
+def test_summary_matches_notebook_cleaning(tmp_path):
+    data = transactions()
+    path = tmp_path / "transactions.csv"
+    data.to_csv(path, index=False)
+
+    expected = reference_summary(data)
+    for kwargs in ({"chunksize": 37, "n_jobs": 1}, {"chunksize": 37, "n_jobs": 2}):
+        summary = build_summary([str(path)], **kwargs)
+        np.testing.assert_array_equal(summary.index.to_numpy(), expected.index.to_numpy().astype(int))
+        np.testing.assert_allclose(summary[expected.columns].to_numpy(), expected.to_numpy())
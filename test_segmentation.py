@@ -0,0 +1,40 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+import segmentation
+from segmentation import assign, fit_kmeans, k_sweep
+
+
+def blobs(n_rows=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.0, 0.0, 0.0], [5.0, 5.0, 0.0], [0.0, 5.0, 5.0]])
+    return (centers[rng.integers(0, 3, n_rows)] + rng.normal(size=(n_rows, 3))).astype(np.float32)
+
+
+def test_assignment_matches_brute_force_distances():
+    features = blobs()
+    centroids = np.random.default_rng(1).normal(size=(4, 3)).astype(np.float32) * 3
+    distances = cdist(features, centroids, "sqeuclidean")
+
+    labels, inertia = segmentation._nearest_centroid(features, centroids, chunk_size=128)
+    np.testing.assert_array_equal(labels, distances.argmin(axis=1))
+    np.testing.assert_allclose(inertia, distances.min(axis=1).sum(), rtol=1e-5)
+    np.testing.assert_array_equal(assign(features, centroids, chunk_size=1000), labels)
+
+def test_streaming_fit_matches_in_memory_fit(tmp_path, monkeypatch):
+    features = blobs()
+    exact = fit_kmeans(features, 3)
+    monkeypatch.setattr(segmentation, "LARGE_INPUT", 1000)
+    path = tmp_path / "features.npy"
+    np.save(path, features)
+    streamed = fit_kmeans(np.load(path, mmap_mode="r"), 3, chunk_size=500)
+
+    np.testing.assert_allclose(streamed["inertia"], exact["inertia"], rtol=0.05)
+    np.testing.assert_allclose(streamed["silhouette"], exact["silhouette"], atol=0.02)
+
+def test_parallel_sweep_matches_serial_sweep():
+    features = blobs(600)
+    serial, _ = k_sweep(features, ks=[2, 3], n_jobs=1)
+    parallel, centroids = k_sweep(features, ks=[2, 3], n_jobs=2)
+    np.testing.assert_allclose(parallel[["inertia", "silhouette"]], serial[["inertia", "silhouette"]], rtol=1e-5)
+    assert centroids[3].shape == (3, 3)